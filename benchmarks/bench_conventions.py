@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark ``data()`` and ``etree()`` of every convention on the synthetic documents of
+``benchmarks/documents.py``: throughput in elements per second and the peak Python memory of one
+``data()`` call (tracemalloc, lxml's own memory is not included). The MINiML-like document is
+also converted with ``xml_schema`` (tests/MINiML.xsd), ``harmonize_synonyms`` and both.
+
+GData, Yahoo and Cobra cannot convert the data of namespaced documents back. Their ``etree()``
+is measured on the same document without namespaces (``documents.without_namespaces``), marked
+with ``*``. Results that could not be measured at all are listed at the end.
+
+Run from the repository root::
+
+    python benchmarks/bench_conventions.py [--scale 0.1] [--save before.json]
+    python benchmarks/bench_conventions.py --compare before.json [--tolerance 0.2]
+
+With ``--compare``, results that are more than ``tolerance`` slower or use more than
+``tolerance`` more memory than the saved ones are listed and the exit status is 1, e.g. to check
+a release branch against the last release.
+'''
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, '.')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import xmljson  # noqa: E402 (needs the repository on sys.path)
+from documents import DOCUMENTS, nodes, without_namespaces  # noqa: E402
+
+CONVENTIONS = (xmljson.BadgerFish, xmljson.GData, xmljson.Parker, xmljson.Abdera,
+               xmljson.Cobra, xmljson.Yahoo)
+SCHEMA = os.path.join('tests', 'MINiML.xsd')
+# variant -> converter options, variants other than 'plain' only apply to the MINiML document
+VARIANTS = {
+    'plain': {},
+    'schema': {'xml_schema': SCHEMA},
+    'harmonize': {'harmonize_synonyms': True},
+    'schema+harmonize': {'xml_schema': SCHEMA, 'harmonize_synonyms': True},
+}
+# measures that get worse when they grow
+LOWER_IS_BETTER = {'peak_kib'}
+
+
+def peak_kib(func):
+    '''Peak memory in KiB that Python allocates while func() runs'''
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def measure(conv, root, repeat):
+    '''Return {measure: value}, an error is stored as the exception name'''
+    count, result = nodes(root), {}
+    try:
+        data = conv.data(root)
+        seconds = min(timeit.repeat(lambda: conv.data(root), number=1, repeat=repeat))
+        result['data_nodes_s'] = count / seconds
+        result['peak_kib'] = peak_kib(lambda: conv.data(root))
+    except Exception as error:
+        return {'data_nodes_s': type(error).__name__}
+    try:
+        conv.etree(data)
+    except Exception:
+        # measured on the same tree without namespaces, which the convention can convert back
+        data = conv.data(without_namespaces(root))
+        result['etree_input'] = 'without namespaces'
+    try:
+        seconds = min(timeit.repeat(lambda: conv.etree(data), number=1, repeat=repeat))
+        result['etree_nodes_s'] = count / seconds
+    except Exception as error:
+        result['etree_nodes_s'] = type(error).__name__
+    return result
+
+
+def run(scale, repeat):
+    '''Return {'document/convention/variant': {measure: value}}'''
+    results = {}
+    for document, generate in DOCUMENTS.items():
+        root = generate(scale)
+        for variant, options in VARIANTS.items():
+            if variant != 'plain' and document != 'miniml':
+                continue
+            for cls in CONVENTIONS:
+                # the schema is compiled once per converter, outside of the measured calls
+                key = '/'.join((document, cls.__name__, variant))
+                results[key] = measure(cls(**options), root, repeat)
+                report(key, results[key])
+    return results
+
+
+def report(key, result):
+    def cell(name, fmt):
+        value = result.get(name, '-')
+        return fmt % value if isinstance(value, float) else '%12s' % value
+    etree = cell('etree_nodes_s', '%12.0f') + ('*' if 'etree_input' in result else ' ')
+    print('%-36s %s %s %s' % (key, cell('data_nodes_s', '%12.0f'), etree,
+                              cell('peak_kib', '%12.0f')))
+
+
+def unmeasured(results):
+    '''Yield (key, measure, exception name) for every result that could not be measured'''
+    for key, result in sorted(results.items()):
+        for name in ('data_nodes_s', 'etree_nodes_s'):
+            if name not in result:
+                yield key, name, 'not measured, data() failed'
+            elif not isinstance(result[name], float):
+                yield key, name, result[name]
+
+
+def regressions(results, baseline, tolerance):
+    '''Yield (key, measure, before, after) for every measure worse than baseline by tolerance'''
+    for key, before in sorted(baseline.items()):
+        after = results.get(key, {})
+        for name, old in sorted(before.items()):
+            new = after.get(name)
+            if not isinstance(old, float):
+                continue
+            if not isinstance(new, float):
+                yield key, name, old, new
+            elif name in LOWER_IS_BETTER and new > old * (1 + tolerance):
+                yield key, name, old, new
+            elif name not in LOWER_IS_BETTER and new < old / (1 + tolerance):
+                yield key, name, old, new
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='benchmark all conventions')
+    parser.add_argument('--scale', type=float, default=1.0, help='document size, defaults to 1')
+    parser.add_argument('--repeat', type=int, default=3, help='best of repeat runs, defaults to 3')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare with results saved by --save')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown or memory growth, defaults to 0.2 (20%%)')
+    args = parser.parse_args(args)
+
+    # deep documents are converted by etree() recursively
+    sys.setrecursionlimit(10000)
+    print('%-36s %12s %12s %12s' % ('document/convention/variant', 'data nodes/s',
+                                    'etree nodes/s', 'peak KiB'))
+    results = run(args.scale, args.repeat)
+    print('* etree() of the document without namespaces')
+    for key, name, error in unmeasured(results):
+        print('unmeasured %s %s: %s' % (key, name, error))
+    if args.save:
+        with open(args.save, 'w') as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+        worse = list(regressions(results, baseline, args.tolerance))
+        for key, name, old, new in worse:
+            print('regression %s %s: %s -> %s' % (key, name, old, new))
+        return 1 if worse else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark JSON output of every convention on the synthetic documents of
+``benchmarks/documents.py``: ``json.dump(data(root))``, the previous ``dump()`` (json.dump with the
+children of root converted one at a time) and ``dump()``, which writes the JSON text straight
+from the element tree. Prints elements per second and the peak Python memory (tracemalloc) of
+one call. The output is written to a file object that discards it.
+
+Run from the repository root::
+
+    python benchmarks/bench_dump.py [--scale 0.1] [--indent 2]
+'''
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, '.')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import xmljson  # noqa: E402 (needs the repository on sys.path)
+from documents import DOCUMENTS, nodes  # noqa: E402
+
+CONVENTIONS = (xmljson.BadgerFish, xmljson.GData, xmljson.Parker, xmljson.Abdera,
+               xmljson.Cobra, xmljson.Yahoo)
+
+
+class Discard(object):
+    '''File object that counts and drops what is written'''
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, text):
+        self.size += len(text)
+
+
+def peak_kib(func):
+    '''Peak memory in KiB that Python allocates while func() runs'''
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def writers(conv, root, kwargs):
+    '''Return {name: function that writes the JSON of root}'''
+    return {
+        'data+json': lambda: json.dump(conv.data(root), Discard(), default=xmljson.json_default,
+                                       **kwargs),
+        'deferred': lambda: conv._dump_deferred(root, Discard(), **kwargs),
+        'dump': lambda: conv.dump(root, Discard(), **kwargs),
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='benchmark JSON output of all conventions')
+    parser.add_argument('--scale', type=float, default=1.0, help='document size, defaults to 1')
+    parser.add_argument('--repeat', type=int, default=3, help='best of repeat runs, defaults to 3')
+    parser.add_argument('--indent', type=int, help='indent the JSON, by default it is not')
+    args = parser.parse_args(args)
+    kwargs = {} if args.indent is None else {'indent': args.indent}
+
+    # deep documents are converted by data() and the deferred dump() without recursion, but
+    # json.dump encodes their data recursively
+    sys.setrecursionlimit(10000)
+    print('%-24s %-10s %12s %10s %8s' % ('document/convention', 'output', 'nodes/s', 'peak KiB',
+                                         'speedup'))
+    for document, generate in DOCUMENTS.items():
+        root = generate(args.scale)
+        count = nodes(root)
+        for cls in CONVENTIONS:
+            conv = cls()
+            key = '%s/%s' % (document, cls.__name__)
+            try:
+                conv.data(root)
+            except Exception as error:
+                print('%-24s %s' % (key, type(error).__name__))
+                continue
+            baseline = None
+            for name, func in writers(conv, root, kwargs).items():
+                seconds = min(timeit.repeat(func, number=1, repeat=args.repeat))
+                baseline = baseline or seconds
+                print('%-24s %-10s %12.0f %10.0f %7.2fx' % (key, name, count / seconds,
+                                                            peak_kib(func), baseline / seconds))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
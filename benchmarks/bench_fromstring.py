@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark type inference of XML string values (``xmljson.inference``) against the previous
+``XMLData._fromstring``, which used exceptions as control flow.
+
+Run from the repository root::
+
+    python benchmarks/bench_fromstring.py
+'''
+import sys
+import timeit
+
+# needs the repository on sys.path
+sys.path.insert(0, '.')
+from xmljson.inference import infer_type, TypeInference  # noqa: E402
+
+
+def previous_fromstring(value):
+    '''XMLData._fromstring before xmljson.inference'''
+    if value is None:
+        return None
+    if value.lower() == 'true':
+        return True
+    elif value.lower() == 'false':
+        return False
+    try:
+        if value.lower().startswith('0'):
+            return value
+        else:
+            return int(value.lower())
+    except ValueError:
+        pass
+    try:
+        if float('-inf') < float(value) < float('inf'):
+            return float(value)
+    except ValueError:
+        pass
+    return value
+
+
+# attribute and text values as found in MINiML documents
+VALUES = {
+    'text': ['GSM908630', 'Danio rerio', 'total RNA', 'Illumina HiSeq 2000', 'whole embryo'],
+    'int': ['7955', '1', '2', '25000', '-3'],
+    'float': ['1.5', '24.75', '-0.25e3', '3.14159', '.5'],
+    'mixed': ['GSM908630', '7955', 'true', '0123', '1.5', 'NaN', 'total RNA', '2'],
+}
+
+
+def microseconds_per_value(func, values, number=50000):
+    values = values * (number // len(values))
+    seconds = min(timeit.repeat(lambda: [func(value) for value in values], number=1, repeat=3))
+    return seconds / len(values) * 1e6
+
+
+def main():
+    cached = TypeInference(cache_size=4096)
+    print('%-8s %12s %12s %12s' % ('values', 'previous us', 'infer us', 'cached us'))
+    for name, values in VALUES.items():
+        times = [microseconds_per_value(func, values)
+                 for func in (previous_fromstring, infer_type, cached)]
+        print('%-8s %12.3f %12.3f %12.3f' % tuple([name] + times))
+
+
+if __name__ == '__main__':
+    main()
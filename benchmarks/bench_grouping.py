@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark the grouping of children into single values and arrays on wide elements with
+thousands of repeated siblings. The grouping stage alone is timed as the previous Counter
+pre-scan (list of children, Counter of their tags, then the tag of every child again) and as
+``XMLData._grouped_children``, which reads every tag once. Then ``data()`` and ``dump()`` of every
+convention are timed on the same elements, with and without prefixed namespaces.
+
+Run from the repository root::
+
+    python benchmarks/bench_grouping.py [--siblings 5000] [--tags 4]
+'''
+import argparse
+import sys
+import timeit
+from collections import Counter
+
+import lxml.etree as ET
+
+sys.path.insert(0, '.')
+import xmljson  # noqa: E402 (needs the repository on sys.path)
+
+CONVENTIONS = (xmljson.BadgerFish, xmljson.GData, xmljson.Parker, xmljson.Abdera,
+               xmljson.Cobra, xmljson.Yahoo)
+NAMESPACE = 'http://example.com/ns'
+XMLData = xmljson.XMLData
+
+
+class Discard(object):
+    '''File object that drops what is written'''
+
+    def write(self, text):
+        pass
+
+
+def repeated_tree(siblings, tags, uri=None):
+    '''<root> with siblings children under tags repeated tags and one unique child'''
+    name = '{%s}%%s' % uri if uri else '%s'
+    nsmap = {'n': uri} if uri else None
+    root = ET.Element(name % 'root', nsmap=nsmap)
+    ET.SubElement(root, name % 'header').text = 'header'
+    for i in range(siblings):
+        ET.SubElement(root, name % ('item%d' % (i % tags))).text = str(i)
+    return root
+
+
+def counter_grouping(root, context):
+    '''The previous grouping: children, a Counter of their tags and the tag of every child'''
+    children = XMLData._children(root, context)
+    count = Counter(child.tag for child in children)
+    return [count[child.tag] == 1 for child in children]
+
+
+def grouped_children(root, context):
+    '''The grouping with XMLData._grouped_children'''
+    children, tags, counts = XMLData._grouped_children(root, context)
+    return [counts[tag] == 1 for tag in tags]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='benchmark grouping of repeated children')
+    parser.add_argument('--siblings', type=int, default=5000,
+                        help='number of repeated children, defaults to 5000')
+    parser.add_argument('--tags', type=int, default=4,
+                        help='number of different repeated tags, defaults to 4')
+    parser.add_argument('--repeat', type=int, default=5, help='best of repeat runs, defaults to 5')
+    args = parser.parse_args(args)
+
+    documents = {'plain': (repeated_tree(args.siblings, args.tags), {}),
+                 'prefixed': (repeated_tree(args.siblings, args.tags, NAMESPACE),
+                              {'ns_as_prefix': True})}
+    print('%-28s %12s' % ('grouping', 'children/s'))
+    for name, (root, _) in documents.items():
+        context = xmljson._Context()
+        for func in (counter_grouping, grouped_children):
+            seconds = min(timeit.repeat(lambda: func(root, context), number=10,
+                                        repeat=args.repeat)) / 10
+            print('%-28s %12.0f' % ('%s/%s' % (name, func.__name__), len(root) / seconds))
+
+    print('%-28s %-6s %12s' % ('document/convention', 'output', 'children/s'))
+    for name, (root, kwargs) in documents.items():
+        for cls in CONVENTIONS:
+            conv = cls(**kwargs)
+            key = '%s/%s' % (name, cls.__name__)
+            for output, func in (('data', lambda: conv.data(root)),
+                                 ('dump', lambda: conv.dump(root, Discard()))):
+                try:
+                    seconds = min(timeit.repeat(func, number=1, repeat=args.repeat))
+                except Exception as error:
+                    print('%-28s %-6s %s' % (key, output, type(error).__name__))
+                    continue
+                print('%-28s %-6s %12.0f' % (key, output, len(root) / seconds))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
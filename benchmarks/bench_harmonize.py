@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark the per-value cost of the harmonization parsers (``xmljson.harmonize``), with
+compiled patterns only (``__wrapped__``, no memo) and with the memo GEO's repeated values hit.
+
+Run from the repository root::
+
+    python benchmarks/bench_harmonize.py
+'''
+import sys
+import timeit
+
+sys.path.insert(0, '.')
+from xmljson import harmonize  # noqa: E402 (needs the repository on sys.path)
+
+# typical Characteristics and Treatment-Protocol contents, repeated across samples
+AGES = ['24 hpf', '48hpf', '5 dpf', '72 hours post fertilization', '3.5 hpf']
+TREATMENTS = ['10 mg/l DMSO', '100 nM ethanol', '50 uM TCDD for 1 hour', '1 ug/ml LPS', 'control']
+PROTOCOLS = ['embryos were exposed for 30 min at 28C', 'treated for 0.5h in E3 medium',
+             'exposure 24 hours, then washed', 'heat shock 1 hour at 37 degrees',
+             '12 h in the dark']
+
+
+def microseconds_per_value(func, values, number=20000):
+    values = values * (number // len(values))
+    seconds = min(timeit.repeat(lambda: [func(value) for value in values], number=1, repeat=3))
+    return seconds / len(values) * 1e6
+
+
+def main():
+    print('%-38s %12s %12s' % ('parser', 'compiled us', 'memo us'))
+    for func, values in ((harmonize.parse_for_hpf, AGES),
+                         (harmonize.parse_for_concentration_and_compound, TREATMENTS),
+                         (harmonize.parse_for_exposure_duration, PROTOCOLS)):
+        # parse_for_concentration_and_compound copies the memoized _concentration_and_compound
+        uncached = (getattr(func, '__wrapped__', None) or
+                    harmonize._concentration_and_compound.__wrapped__)
+        print('%-38s %12.2f %12.2f' % (func.__name__, microseconds_per_value(uncached, values),
+                                       microseconds_per_value(func, values)))
+    units = ['hpf', 'min', 's', 'hours']
+    print('%-38s %12s %12.2f' % ('convert_to_hours', '-', microseconds_per_value(
+        lambda unit: harmonize.convert_to_hours('24', unit), units)))
+
+
+if __name__ == '__main__':
+    main()
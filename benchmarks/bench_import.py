@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark the time of ``import xmljson`` in a new interpreter (``python -X importtime``), as paid
+by every command line call and serverless cold start, and list the slowest imported modules.
+xmlschema, asyncio, concurrent.futures and config are only imported when a converter needs them.
+
+Run from the repository root::
+
+    python benchmarks/bench_import.py [--repeat 5] [--code "import xmljson; xmljson.GData()"]
+'''
+import argparse
+import subprocess
+import sys
+
+
+def importtime(code):
+    '''Return {module: (self microseconds, cumulative microseconds)} of one run of code'''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and 'self [us]' not in line:
+            own, cumulative, module = line[len('import time:'):].split('|')
+            times[module.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='benchmark import xmljson')
+    parser.add_argument('--repeat', type=int, default=5, help='best of repeat runs, defaults to 5')
+    parser.add_argument('--code', default='import xmljson', help='code to run, defaults to '
+                                                                 '"import xmljson"')
+    parser.add_argument('--top', type=int, default=10, help='number of modules to list')
+    args = parser.parse_args(args)
+
+    # the first run also fills the OS file cache
+    runs = [importtime(args.code) for _ in range(args.repeat + 1)][1:]
+    best = min(runs, key=lambda times: sum(own for own, _ in times.values()))
+    print('%s: %.1f ms, %d modules' % (args.code, sum(own for own, _ in best.values()) / 1000.0,
+                                       len(best)))
+    print('%-40s %10s %10s' % ('module', 'self ms', 'total ms'))
+    for module, (own, cumulative) in sorted(best.items(), key=lambda item: -item[1][0])[:args.top]:
+        print('%-40s %10.1f %10.1f' % (module, own / 1000.0, cumulative / 1000.0))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
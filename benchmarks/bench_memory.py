@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark the memory of converted data: bytes per converted element that the result of
+``data()`` keeps alive (tracemalloc), and the conversion time, with the default OrderedDict
+containers, ``compact=True`` (plain dicts) and ``compact=True, list_type=RecordList``.
+
+Run from the repository root::
+
+    python benchmarks/bench_memory.py [scale]
+'''
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, '.')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import xmljson  # noqa: E402 (needs the repository on sys.path)
+from documents import DOCUMENTS, nodes  # noqa: E402
+
+MODES = [
+    ('OrderedDict', {}),
+    ('compact', {'compact': True}),
+    ('compact+RecordList', {'compact': True, 'list_type': xmljson.RecordList}),
+]
+
+
+def retained_bytes(func):
+    '''Bytes that Python allocated during func() and that its result keeps alive'''
+    tracemalloc.start()
+    try:
+        result = func()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    print('%-12s %-12s %-20s %14s %10s' % ('document', 'convention', 'containers', 'bytes/element',
+                                           'ms'))
+    for document in ('wide', 'attributes', 'miniml'):
+        root = DOCUMENTS[document](scale)
+        count = nodes(root)
+        for cls in (xmljson.BadgerFish, xmljson.GData, xmljson.Parker):
+            for mode, options in MODES:
+                conv = cls(**options)
+                size = retained_bytes(lambda: conv.data(root))
+                seconds = min(timeit.repeat(lambda: conv.data(root), number=1, repeat=3))
+                print('%-12s %-12s %-20s %14.0f %10.1f' % (document, cls.__name__, mode,
+                                                           size / count, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
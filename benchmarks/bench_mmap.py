@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark reading input through a memory map (``xmljson.mapped``, ``xml2json --mmap``) against
+the file object path, for whole documents and iterparse. The Sample elements of
+tests/GSE37019_family.xml are repeated into a large temporary document.
+
+Every input is timed cold (the file dropped from the page cache with posix_fadvise, where the OS
+supports it) and warm, with the minor and major page faults of the process during the run.
+
+Run from the repository root::
+
+    python benchmarks/bench_mmap.py [copies]
+'''
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, '.')
+import lxml.etree as ET  # noqa: E402
+import xmljson  # noqa: E402 (needs the repository on sys.path)
+
+SOURCE = os.path.join('tests', 'GSE37019_family.xml')
+
+
+def build(path, copies):
+    '''Write a MINiML document with the samples of SOURCE repeated copies times'''
+    root = ET.parse(SOURCE).getroot()
+    samples = b''.join(ET.tostring(elem) for elem in root.iterchildren('{*}Sample'))
+    with open(path, 'wb') as handle:
+        handle.write(b'<MINiML xmlns="%s">' % root.nsmap[None].encode())
+        for _ in range(copies):
+            handle.write(samples)
+        handle.write(b'</MINiML>')
+
+
+def drop_cache(path):
+    if hasattr(os, 'posix_fadvise'):
+        with open(path, 'rb') as handle:
+            os.posix_fadvise(handle.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def document_text(path):
+    with open(path, encoding='utf-8') as handle:
+        return ET.parse(handle).getroot()
+
+
+def document_mmap(path):
+    return xmljson.parse_mapped(path)
+
+
+def records_file(path):
+    with open(path, 'rb') as handle:
+        return sum(1 for _ in ET.iterparse(handle, tag='{*}Sample'))
+
+
+def records_mmap(path):
+    with xmljson.mapped(path) as source:
+        return sum(1 for _ in ET.iterparse(source, tag='{*}Sample'))
+
+
+def measure(func, path, cold):
+    if cold:
+        drop_cache(path)
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    func(path)
+    seconds = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    return seconds, after.ru_minflt - before.ru_minflt, after.ru_majflt - before.ru_majflt
+
+
+def main():
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    path = os.path.join(tempfile.mkdtemp(), 'bench_mmap.xml')
+    build(path, copies)
+    print('%d MB, %s' % (os.path.getsize(path) // 2 ** 20, 'cold runs drop the page cache'
+                         if hasattr(os, 'posix_fadvise') else 'no posix_fadvise, cold = warm'))
+    print('%-16s %-5s %10s %12s %12s' % ('input', 'cache', 'seconds', 'minor faults',
+                                         'major faults'))
+    try:
+        for func in (document_text, document_mmap, records_file, records_mmap):
+            for cold in (True, False):
+                # best of three, the warm runs follow a run that filled the page cache
+                runs = [measure(func, path, cold) for _ in range(3)]
+                seconds, minor, major = min(runs)
+                print('%-16s %-5s %10.3f %12d %12d' % (
+                    func.__name__, 'cold' if cold else 'warm', seconds, minor, major))
+    finally:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+
+
+if __name__ == '__main__':
+    main()
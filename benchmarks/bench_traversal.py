@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark the explicit-stack conversion engine (``XMLData._walk``) against the same
+conversion frames driven recursively, i.e. one Python call per element.
+
+Run from the repository root::
+
+    python benchmarks/bench_traversal.py
+'''
+import os
+import sys
+import timeit
+
+sys.path.insert(0, '.')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import xmljson  # noqa: E402 (needs the repository on sys.path)
+from documents import wide_tree, deep_tree, nodes  # noqa: E402
+
+
+def recursive(cls):
+    '''Subclass of cls that drives the conversion frames with the call stack'''
+    class Recursive(cls):
+        def _walk(self, root, schema, converted=None, context=None):
+            context = xmljson._Context() if context is None else context
+            frame, data = self._node(root, schema, context), None
+            while True:
+                try:
+                    child = frame.send(data)
+                except StopIteration as done:
+                    return done.value
+                data = self._walk(child, None, context=context)
+    return Recursive
+
+
+def nodes_per_second(conv, root, repeat=3):
+    count = nodes(root)
+    seconds = min(timeit.repeat(lambda: conv.data(root), number=1, repeat=repeat))
+    return count / seconds
+
+
+def main():
+    sys.setrecursionlimit(10000)
+    trees = [('wide', wide_tree()), ('deep', deep_tree())]
+    print('%-12s %-6s %14s %14s %8s' % ('convention', 'tree', 'stack nodes/s', 'recur nodes/s',
+                                        'ratio'))
+    for cls in (xmljson.BadgerFish, xmljson.GData, xmljson.Parker, xmljson.Abdera,
+                xmljson.Cobra, xmljson.Yahoo):
+        for name, root in trees:
+            stack = nodes_per_second(cls(), root)
+            recur = nodes_per_second(recursive(cls)(), root)
+            print('%-12s %-6s %14.0f %14.0f %8.2f' % (cls.__name__, name, stack, recur,
+                                                      stack / recur))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+'''
+Synthetic documents for the benchmarks. Every generator returns the root element of a new lxml
+tree; ``scale`` multiplies the number of repeated elements.
+'''
+import copy
+
+import lxml.etree as ET
+
+MINIML = 'http://www.ncbi.nlm.nih.gov/geo/info/MINiML'
+
+AGES = ['24 hpf', '48hpf', '90 min', '72 hours post fertilization', '3.5 hpf']
+TREATMENTS = ['10 mg/l DMSO', '100 nM ethanol', '50 uM TCDD', '1 ug/ml LPS', 'control']
+PROTOCOLS = ['embryos were exposed for 30 min at 28C', 'treated for 0.5h in E3 medium',
+             'exposure 24 hours, then washed', 'heat shock 1 hour at 37 degrees']
+
+
+def wide_tree(scale=1.0):
+    '''<root> with many small, partly repeated children'''
+    root = ET.Element('root', version='1')
+    for i in range(int(20000 * scale)):
+        child = ET.SubElement(root, 'item' if i % 2 else 'entry_%d' % i, id=str(i))
+        child.text = str(i)
+    return root
+
+
+def deep_tree(scale=1.0, depth=400):
+    '''chains of depth nested elements'''
+    root = ET.Element('root')
+    for i in range(max(1, int(50 * scale))):
+        node = ET.SubElement(root, 'chain')
+        for level in range(depth):
+            node = ET.SubElement(node, 'level', n=str(level))
+        node.text = 'leaf'
+    return root
+
+
+def attribute_tree(scale=1.0, attributes=20):
+    '''records with many typed attributes and little text'''
+    root = ET.Element('root')
+    for i in range(int(2000 * scale)):
+        record = ET.SubElement(root, 'record', id=str(i))
+        for n in range(attributes):
+            record.set('a%d' % n, ('%d' % (i * n), '%d.5' % n, 'true', 'text %d' % n)[n % 4])
+        ET.SubElement(record, 'note').text = 'record %d' % i
+    return root
+
+
+def namespace_tree(scale=1.0, namespaces=8):
+    '''records spread over several prefixed namespaces, with namespace declarations on the
+    records'''
+    nsmap = {'n%d' % n: 'http://example.com/ns/%d' % n for n in range(namespaces)}
+    root = ET.Element('{http://example.com/ns/0}root', nsmap=nsmap)
+    for i in range(int(2000 * scale)):
+        uri = 'http://example.com/ns/%d' % (i % namespaces)
+        record = ET.SubElement(root, '{%s}record' % uri, nsmap={'r': 'http://example.com/record'})
+        record.set('{http://example.com/record}id', str(i))
+        for n in range(namespaces):
+            ET.SubElement(record, '{http://example.com/ns/%d}field' % n).text = str(n)
+    return root
+
+
+def miniml_tree(scale=1.0):
+    '''MINiML family document with Samples whose Characteristics and Treatment-Protocol are
+    harmonized by harmonize_synonyms, and typed by MINiML.xsd'''
+    root = ET.Element('{%s}MINiML' % MINIML, nsmap={None: MINIML}, version='0.5.0')
+    ET.SubElement(root, '{%s}Platform' % MINIML, iid='GPL14664')
+    for i in range(int(1000 * scale)):
+        sample = ET.SubElement(root, '{%s}Sample' % MINIML, iid='GSM%d' % (900000 + i))
+        status = ET.SubElement(sample, '{%s}Status' % MINIML, database='GEO')
+        ET.SubElement(status, '{%s}Submission-Date' % MINIML).text = '2012-04-03'
+        ET.SubElement(sample, '{%s}Title' % MINIML).text = 'embryo sample %d' % i
+        ET.SubElement(sample, '{%s}Type' % MINIML).text = 'RNA'
+        channel = ET.SubElement(sample, '{%s}Channel' % MINIML, position='1')
+        ET.SubElement(channel, '{%s}Source' % MINIML).text = 'whole embryo'
+        ET.SubElement(channel, '{%s}Organism' % MINIML, taxid='7955').text = 'Danio rerio'
+        characteristics = (('developmental stage', AGES[i % len(AGES)]),
+                           ('treatment', TREATMENTS[i % len(TREATMENTS)]),
+                           ('genotype', 'wild type'))
+        for tag, text in characteristics:
+            ET.SubElement(channel, '{%s}Characteristics' % MINIML, tag=tag).text = text
+        protocol = ET.SubElement(channel, '{%s}Treatment-Protocol' % MINIML)
+        protocol.text = PROTOCOLS[i % len(PROTOCOLS)]
+        ET.SubElement(channel, '{%s}Molecule' % MINIML).text = 'total RNA'
+        ET.SubElement(sample, '{%s}Platform-Ref' % MINIML, ref='GPL14664')
+        table = ET.SubElement(sample, '{%s}Data-Table' % MINIML)
+        for position in range(1, 3):
+            column = ET.SubElement(table, '{%s}Column' % MINIML, position=str(position))
+            ET.SubElement(column, '{%s}Name' % MINIML).text = ('ID_REF', 'VALUE')[position - 1]
+        ET.SubElement(table, '{%s}Internal-Data' % MINIML, rows='0')
+    return root
+
+
+# name -> generator, in the order the benchmarks report them
+DOCUMENTS = {
+    'wide': wide_tree,
+    'deep': deep_tree,
+    'attributes': attribute_tree,
+    'namespaces': namespace_tree,
+    'miniml': miniml_tree,
+}
+
+
+def nodes(root):
+    '''Number of elements in the tree of root'''
+    return sum(1 for _ in root.iter())
+
+
+def without_namespaces(root):
+    '''Copy of the tree of root with the localnames of all tags and attributes, and no namespace
+    declarations. Conventions that cannot convert namespaced data back (etree()) can convert it.'''
+    root = copy.deepcopy(root)
+    for elem in root.iter(ET.Element):
+        elem.tag = ET.QName(elem).localname
+        for name in [name for name in elem.attrib if name.startswith('{')]:
+            elem.set(ET.QName(name).localname, elem.attrib.pop(name))
+    ET.cleanup_namespaces(root)
+    return root
@@ -28,6 +28,7 @@ setup(
                  'xmljson'},
     include_package_data=True,
     install_requires=[],
+    python_requires='>=3.7',
     license='MIT',
     zip_safe=False,
     keywords='xmljson',
@@ -36,11 +37,11 @@ setup(
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',    # For collections.Counter
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3 :: Only',
         'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
         'Topic :: Software Development',
         'Topic :: Software Development :: Libraries :: Python Modules',
     ],
@@ -12,6 +12,7 @@ import io
 import os
 import sys
 import json
+import pickle
 import unittest
 
 from collections import OrderedDict as Dict
@@ -63,6 +64,61 @@ class TestCLI(unittest.TestCase):
                 with closing(in_file), closing(out_file):
                     self.assertEqual(json.load(out_file), dialect.data(parse(in_file).getroot()))
 
+    def test_cli_compact(self):
+        in_file = io.open(os.path.join(_folder, 'GSE37019_family.xml'), encoding='utf-8')
+        out_file = openwrite(self.tmp)
+        main(in_file, out_file, xmljson.GData(), compact=True)
+        with closing(io.open(self.tmp, encoding='utf-8')) as out_file:
+            text = out_file.read()
+        self.assertNotIn('\n', text)
+        self.assertEqual(json.loads(text), xmljson.GData().data(parse(
+            os.path.join(_folder, 'GSE37019_family.xml')).getroot()))
+
+    def test_cli_ndjson(self):
+        path = os.path.join(_folder, 'GSE37019_family.xml')
+        main(io.open(path, encoding='utf-8'), openwrite(self.tmp), xmljson.GData(),
+             ndjson=True, record_tag=['Sample', 'Series'])
+        with closing(io.open(self.tmp, encoding='utf-8')) as out_file:
+            lines = out_file.read().splitlines()
+        self.assertEqual(len(lines), 10)
+        self.assertEqual([json.loads(line) for line in lines],
+                         list(xmljson.GData().iterdata(path, ('Sample', 'Series'))))
+
+    def test_cli_mmap(self):
+        path = os.path.join(_folder, 'GSE37019_family.xml')
+        main(io.open(path, encoding='utf-8'), openwrite(self.tmp), xmljson.GData(), mmap=True)
+        with closing(io.open(self.tmp, encoding='utf-8')) as out_file:
+            self.assertEqual(json.load(out_file), xmljson.GData().data(parse(path).getroot()))
+        main(io.open(path, encoding='utf-8'), openwrite(self.tmp), xmljson.GData(), mmap=True,
+             ndjson=True, record_tag=['Sample'])
+        with closing(io.open(self.tmp, encoding='utf-8')) as out_file:
+            self.assertEqual([json.loads(line) for line in out_file],
+                             list(xmljson.GData().iterdata(path, 'Sample')))
+
+    def test_cli_batch(self):
+        out_dir = os.path.join(_folder, 'delete-batch')
+        bad = os.path.join(out_dir, 'bad.xml')
+        paths = [os.path.join(_folder, path) for path in ('abdera-1.xml', 'GSE37019_family.xml')]
+        os.makedirs(out_dir)
+        try:
+            with closing(openwrite(bad)) as handle:
+                handle.write(u'<broken')
+            for jobs in (1, 2):
+                status = main(None, None, xmljson.GData(), inputs=paths + [bad], out_dir=out_dir,
+                              jobs=jobs)
+                self.assertEqual(status, 1)
+                self.assertFalse(os.path.exists(os.path.join(out_dir, 'bad.json')))
+                for path in paths:
+                    name = os.path.splitext(os.path.basename(path))[0] + '.json'
+                    with closing(io.open(os.path.join(out_dir, name), encoding='utf-8')) as out:
+                        self.assertEqual(json.load(out),
+                                         xmljson.GData().data(parse(path).getroot()))
+            self.assertEqual(main(None, None, xmljson.GData(), inputs=paths, out_dir=out_dir), 0)
+        finally:
+            for name in os.listdir(out_dir):
+                os.remove(os.path.join(out_dir, name))
+            os.rmdir(out_dir)
+
     def tearDown(self):
         if os.path.exists(self.tmp):
             os.remove(self.tmp)
@@ -741,6 +797,22 @@ class TestYahoo(TestXmlJson):
         j2x_strings({"x": True}, '<x>True</x>')
         j2x_convert({"x": False}, '<x>false</x>')
         j2x_strings({"x": False}, '<x>False</x>')
+
+    def test_default_output(self):
+        'values stay strings by default, a schema types them'
+        root = fromstring('<x a="1"><y>2</y><y>true</y></x>')
+        self.assertEqual(xmljson.yahoo.data(root), {'x': {'a': '1', 'y': ['2', 'true']}})
+        yahoo = xmljson.Yahoo(xml_schema=os.path.join(_folder, 'MINiML.xsd'))
+        sample = yahoo.data(parse(os.path.join(_folder, 'GSE37019_family.xml')).getroot())
+        self.assertEqual(sample['MINiML']['Sample'][0]['Channel-Count'], 1)
+
+    def test_options(self):
+        'constructor options are passed on like in the other conventions'
+        conv = xmljson.Yahoo(dict_type=dict, list_type=xmljson.RecordList)
+        data = conv.data(fromstring('<a><b>1</b><b>2</b></a>'))
+        self.assertIs(type(data), dict)
+        self.assertIsInstance(data['a']['b'], xmljson.RecordList)
+        self.assertEqual(list(data['a']['b']), ['1', '2'])
 class TestAbdera(TestXmlJson):
     @unittest.skip('To be written')
     def test_etree(self, converter=None):
@@ -890,4 +962,693 @@ class TestCobra(TestXmlJson):
     @unittest.skip('To be written')
     def schema_type_inference(self, converter=None):
         'Type inference from XML Schema for Cobra'
-        pass
\ No newline at end of file
+        pass
+
+
+class TestIterData(unittest.TestCase):
+
+    def test_iterdata(self):
+        'iterdata yields the same records as converting each record as a document'
+        path = os.path.join(_folder, 'GSE37019_family.xml')
+        root = parse(path).getroot()
+        for cls in (xmljson.BadgerFish, xmljson.GData, xmljson.Parker, xmljson.Abdera,
+                    xmljson.Cobra, xmljson.Yahoo):
+            records = list(cls().iterdata(path, ('Sample', 'Series')))
+            expected = [cls().data(elem) for elem in root
+                        if lxml.etree.QName(elem).localname in ('Sample', 'Series')]
+            self.assertEqual(len(records), 10)
+            self.assertEqual(records, expected)
+
+    def test_iterdata_tags(self):
+        'iterdata matches full tags and localnames, and keeps document order'
+        xml = b'<root xmlns:n="urn:n"><a>9</a><r>1</r><n:r>2</n:r><b/><r>3</r></root>'
+        parker = xmljson.Parker()
+        self.assertEqual(list(parker.iterdata(io.BytesIO(xml), 'r')), [1, 2, 3])
+        self.assertEqual(list(parker.iterdata(io.BytesIO(xml), '{urn:n}r')), [2])
+        self.assertEqual(list(parker.iterdata(io.BytesIO(xml), ['a', 'r'])), [9, 1, 2, 3])
+
+    def test_iterdata_nested(self):
+        'records inside records are converted with the outer record, not freed before it'
+        import asyncio
+        xml = b'<r><s><a>1</a><s><b>2</b></s><c>3</c></s><s><d>4</d></s></r>'
+        for conv in (xmljson.BadgerFish(), xmljson.Parker(), xmljson.Cobra()):
+            root = lxml.etree.fromstring(xml)
+            expected = [conv.data(root[0]), conv.data(root[1])]
+            self.assertEqual(list(conv.iterdata(io.BytesIO(xml), 's')), expected)
+            self.assertEqual(list(conv.iterdata(io.BytesIO(xml), 's', exclude=['r/s/d'])),
+                             [expected[0], conv.data(lxml.etree.fromstring(b'<s/>'))])
+            self.assertEqual([json.loads(line) for line in conv.ndjson(io.BytesIO(xml), 's')],
+                             json.loads(json.dumps(expected)))
+            feeder = conv.feeder('s')
+            self.assertEqual(feeder.feed(xml[:30]) + feeder.feed(xml[30:]) + feeder.close(),
+                             expected)
+
+            async def records():
+                return [record async for record in conv.aiterdata(xml, 's')]
+            self.assertEqual(asyncio.run(records()), expected)
+
+
+class TestWalk(unittest.TestCase):
+
+    def test_deep_document(self):
+        'Documents nested deeper than the recursion limit convert without RecursionError'
+        depth = sys.getrecursionlimit() * 2
+        root = node = lxml.etree.Element('a')
+        for _ in range(depth):
+            node = lxml.etree.SubElement(node, 'a')
+        node.text = 'leaf'
+        for conv in (xmljson.BadgerFish(), xmljson.GData(), xmljson.Parker(), xmljson.Abdera(),
+                     xmljson.Cobra(), xmljson.Yahoo()):
+            data, levels = conv.data(root), 0
+            while isinstance(data, dict) and ('a' in data or 'children' in data):
+                if 'a' in data:
+                    data, levels = data['a'], levels + 1
+                else:
+                    data = data['children'][0]     # Cobra
+            self.assertGreaterEqual(levels, depth, conv)
+
+
+class TestSchemaIndex(unittest.TestCase):
+    xsd = os.path.join(_folder, 'MINiML.xsd')
+    xml = os.path.join(_folder, 'GSE37019_family.xml')
+
+    def test_schema_typing(self):
+        'Schema types are applied by element path, also in indented documents'
+        gdata = xmljson.GData(xml_schema=self.xsd)
+        sample = gdata.data(parse(self.xml).getroot())['MINiML']['Sample'][0]
+        self.assertEqual(sample['iid'], 'GSM908630')
+        self.assertEqual(sample['Channel-Count'], {'$t': 1})
+        self.assertEqual(sample['Channel']['position'], 1)
+        self.assertEqual(sample['Channel']['Organism']['taxid'], 7955)
+
+        parser = lxml.etree.XMLParser(remove_blank_text=True)
+        self.assertEqual(gdata.data(parse(self.xml).getroot()),
+                         gdata.data(parse(self.xml, parser).getroot()))
+        # records are looked up by their path, not as global elements
+        records = list(gdata.iterdata(self.xml, 'Sample'))
+        self.assertEqual(records[0]['Sample']['Channel-Count'], {'$t': 1})
+
+    def test_pickle(self):
+        'Compiled schema index can be pickled'
+        import pickle
+        index = xmljson.GData(xml_schema=self.xsd).schema_index
+        clone = pickle.loads(pickle.dumps(index))
+        ns = '{http://www.ncbi.nlm.nih.gov/geo/info/MINiML}'
+        node = clone.lookup([ns + 'MINiML', ns + 'Sample', ns + 'Channel-Count'])
+        self.assertEqual(node.text(' 2 '), 2)
+        self.assertIsNone(clone.lookup([ns + 'MINiML', ns + 'Unknown']))
+
+
+class TestConvertParallel(unittest.TestCase):
+    xml = os.path.join(_folder, 'GSE37019_family.xml')
+
+    def test_convert_parallel(self):
+        'convert_parallel() returns the same data as data() for every convention'
+        for cls in (xmljson.BadgerFish, xmljson.GData, xmljson.Parker, xmljson.Abdera,
+                    xmljson.Cobra, xmljson.Yahoo):
+            expected = cls().data(parse(self.xml).getroot())
+            self.assertEqual(cls().convert_parallel(self.xml, 'Sample', workers=2), expected, cls)
+
+        xsd = os.path.join(_folder, 'MINiML.xsd')
+        data = xmljson.GData(xml_schema=xsd).convert_parallel(self.xml, ('Sample', 'Platform'))
+        self.assertEqual(data, xmljson.GData(xml_schema=xsd).data(parse(self.xml).getroot()))
+        self.assertEqual(data['MINiML']['Sample'][0]['Channel-Count'], {'$t': 1})
+
+
+class TestDump(unittest.TestCase):
+    def test_dump(self):
+        'dump() writes the same JSON as json.dump(data())'
+        xml = os.path.join(_folder, 'GSE37019_family.xml')
+        xsd = os.path.join(_folder, 'MINiML.xsd')
+        for conv in (xmljson.BadgerFish, xmljson.GData, xmljson.Parker, xmljson.Abdera,
+                     xmljson.Cobra, xmljson.Yahoo):
+            for kwargs in ({}, {'xml_schema': xsd}, {'ns_as_prefix': False}):
+                expected = json.dumps(conv(**kwargs).data(parse(xml).getroot()), indent=2)
+                out = io.StringIO()
+                conv(**kwargs).dump(parse(xml).getroot(), out, indent=2)
+                self.assertEqual(out.getvalue(), expected, (conv, kwargs))
+
+
+class TestSynonyms(unittest.TestCase):
+    def test_synonyms(self):
+        'Characteristics tags are harmonized by the compiled synonym table'
+        root = fromstring('<Sample>'
+                          '<Characteristics tag="Developmental  Stage">24 hpf</Characteristics>'
+                          '<Characteristics tag="fish line">AB</Characteristics></Sample>')
+
+        def raw_tags(conv):
+            return [c['raw_data']['tag'] for c in conv.data(root)['Sample']['Characteristics']]
+
+        self.assertEqual(raw_tags(xmljson.GData(harmonize_synonyms=True)),
+                         ['Developmental  Stage', 'fish line'])
+        self.assertEqual(raw_tags(xmljson.GData(harmonize_synonyms=True, normalize_synonyms=True)),
+                         ['age_raw', 'fish line'])
+        conv = xmljson.GData(harmonize_synonyms=True, normalize_synonyms=True,
+                             synonyms={'Fish Line': 'genotype_raw'})
+        self.assertEqual(raw_tags(conv), ['age_raw', 'genotype_raw'])
+        with self.assertRaises(TypeError):
+            conv._synonyms['dpf'] = 'other'
+
+    def test_schema(self):
+        'attributes typed by a schema are not normalized'
+        path = os.path.join(_folder, 'GSE37019_family.xml')
+        for cls in (xmljson.GData, xmljson.Abdera, xmljson.Cobra):
+            conv = cls(harmonize_synonyms=True, normalize_synonyms=True,
+                       xml_schema=os.path.join(_folder, 'MINiML.xsd'))
+            expected = cls(harmonize_synonyms=True,
+                           xml_schema=os.path.join(_folder, 'MINiML.xsd'))
+            self.assertEqual(conv.data(parse(path).getroot()),
+                             expected.data(parse(path).getroot()))
+
+
+class TestHarmonize(unittest.TestCase):
+    def test_parsers(self):
+        from xmljson import harmonize
+        self.assertEqual(harmonize.parse_for_hpf('24 hpf'), ('24 ', 'hpf'))
+        self.assertEqual(harmonize.parse_for_concentration_and_compound('10 mg/l DMSO for 30 min'),
+                         ('10 mg/l', 'DMSO for'))
+        self.assertEqual(harmonize.parse_for_exposure_duration('treated for 0.5h'), ('0.5', 'h'))
+        self.assertEqual(harmonize.convert_to_hours('30', 'min'), 0.5)
+        self.assertIsNone(harmonize.convert_to_hours('3', 'dpf'))
+        self.assertEqual(harmonize.calculate_exposure_start('24', 'hpf', '30', 'min'),
+                         '23.5 hours')
+        # memoized results are not shared with the caller
+        first = harmonize.parse_for_concentration_and_compound('control')
+        self.assertEqual(first, ([], 'control'))
+        self.assertIsNot(first[0], harmonize.parse_for_concentration_and_compound('control')[0])
+
+
+class TestInference(unittest.TestCase):
+    def test_infer_type(self):
+        from xmljson.inference import infer_type, TypeInference
+        import pickle
+        for infer in (infer_type, TypeInference(cache_size=16),
+                      pickle.loads(pickle.dumps(TypeInference(cache_size=16)))):
+            for value in ('1', '1', '-3', ' 12', '1_000'):
+                self.assertEqual(infer(value), int(value))
+            self.assertEqual(infer('2.5e3'), 2500.0)
+            self.assertEqual(infer('TRUE'), True)
+            self.assertEqual(infer('false'), False)
+            self.assertIsNone(infer(None))
+            # leading zeros, infinity, NaN and text stay strings
+            for value in ('0', '0123', '0.5', 'inf', 'NaN', '1e400', 'GSM908630', '1 2', ''):
+                self.assertEqual(infer(value), value)
+        conv = xmljson.BadgerFish(xml_fromstring=TypeInference(cache_size=16))
+        self.assertEqual(conv.data(fromstring('<x a="7">0.5</x>')), {'x': {'@a': 7, '$': '0.5'}})
+
+
+class TestContext(unittest.TestCase):
+    def test_reuse(self):
+        'One converter converts many documents, also from several threads'
+        from concurrent.futures import ThreadPoolExecutor
+        xml = os.path.join(_folder, 'GSE37019_family.xml')
+        conv = xmljson.GData(xml_schema=os.path.join(_folder, 'MINiML.xsd'),
+                             harmonize_synonyms=True)
+        expected = conv.data(parse(xml).getroot())
+        self.assertIn('xmlns', expected['MINiML'])
+        self.assertEqual(conv.data(parse(xml).getroot()), expected)
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda _: conv.data(parse(xml).getroot()), range(8)))
+        self.assertEqual(results, [expected] * 8)
+
+
+class TestNamespaceCache(unittest.TestCase):
+    def test_scopes(self):
+        'Cached prefixed names depend on the namespaces in scope, not only on the tag'
+        root = fromstring('<r xmlns:p="urn:p"><p:a>1</p:a><p:a>2</p:a>'
+                          '<b xmlns:p="urn:x" xmlns:q="urn:p"><q:a>3</q:a><q:a>4</q:a></b></r>')
+        self.assertEqual(xmljson.GData().data(root), Dict([('r', Dict([
+            ('p$a', [Dict([('$t', 1)]), Dict([('$t', 2)])]),
+            ('b', Dict([('q$a', [Dict([('$t', 3)]), Dict([('$t', 4)])])]))]))]))
+        self.assertEqual(xmljson.Parker().data(root),
+                         Dict([('a', [1, 2]), ('b', Dict([('a', [3, 4])]))]))
+
+
+class TestAsync(unittest.TestCase):
+    xml = os.path.join(_folder, 'GSE37019_family.xml')
+
+    def test_adata(self):
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        with io.open(self.xml, 'rb') as handle:
+            raw = handle.read()
+
+        async def chunks():
+            for start in range(0, len(raw), 4096):
+                yield raw[start:start + 4096]
+
+        async def convert(conv, executor):
+            data = await conv.adata(chunks(), executor=executor)
+            records = [record async for record in conv.aiterdata(
+                io.BytesIO(raw), 'Sample', executor=executor, chunk_size=4096)]
+            return data, records
+
+        with ThreadPoolExecutor(2) as executor:
+            for conv in (xmljson.BadgerFish(), xmljson.GData(), xmljson.Parker(), xmljson.Abdera(),
+                         xmljson.Cobra(), xmljson.Yahoo()):
+                for pool in (None, executor):
+                    data, records = asyncio.run(convert(conv, pool))
+                    self.assertEqual(data, conv.data(parse(self.xml).getroot()))
+                    self.assertEqual(records, list(conv.iterdata(self.xml, 'Sample')))
+
+    def test_process_pool(self):
+        'process pools are rejected, lxml elements cannot be pickled'
+        import asyncio
+        from concurrent.futures import ProcessPoolExecutor
+
+        async def convert(executor):
+            return [record async for record in xmljson.parker.aiterdata(
+                b'<r><s>1</s></r>', 's', executor=executor)]
+
+        with ProcessPoolExecutor(1) as executor:
+            with self.assertRaises(ValueError):
+                asyncio.run(xmljson.parker.adata(b'<r><s>1</s></r>', executor=executor))
+            with self.assertRaises(ValueError):
+                asyncio.run(convert(executor))
+
+    def test_aiterdata_close(self):
+        'records that only close() completes are converted in the executor too'
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        from unittest import mock
+
+        class Executor(ThreadPoolExecutor):
+            calls = 0
+
+            def submit(self, *args, **kwargs):
+                Executor.calls += 1
+                return super(Executor, self).submit(*args, **kwargs)
+
+        async def convert(executor):
+            return [record async for record in xmljson.parker.aiterdata(
+                b'<r><s>1</s><s>2</s></r>', 's', executor=executor)]
+
+        def feed(records, data):
+            # the parser keeps every event for close()
+            records.parser.feed(data)
+            return iter(())
+
+        with mock.patch.object(xmljson._Records, 'feed', feed), Executor(1) as executor:
+            self.assertEqual(asyncio.run(convert(executor)), [1, 2])
+        self.assertEqual(Executor.calls, 2)
+
+
+class TestFeeder(unittest.TestCase):
+    def test_feeder(self):
+        xml = os.path.join(_folder, 'GSE37019_family.xml')
+        with io.open(xml, 'rb') as handle:
+            raw = handle.read()
+        for conv in (xmljson.BadgerFish(), xmljson.GData(), xmljson.Parker(), xmljson.Abdera(),
+                     xmljson.Cobra(), xmljson.Yahoo()):
+            feeder, records, sizes = conv.feeder(('Sample', 'Series')), [], []
+            for start in range(0, len(raw), 2048):
+                sizes.append(len(records))
+                records += feeder.feed(raw[start:start + 2048])
+            records += feeder.close()
+            self.assertEqual(records, list(conv.iterdata(xml, ('Sample', 'Series'))))
+            # records are returned while the document is fed
+            self.assertGreater(sizes[len(sizes) // 2], 0)
+
+            feeder = conv.feeder()
+            self.assertEqual(feeder.feed(raw), [])
+            self.assertEqual(feeder.close(), [conv.data(parse(xml).getroot())])
+        feeder = xmljson.gdata.feeder('Sample')
+        feeder.feed(b'<MINiML><Sample iid="1"/><Sample')
+        with self.assertRaises(lxml.etree.XMLSyntaxError):
+            feeder.close()
+
+
+class TestWriteXml(unittest.TestCase):
+    def test_write_xml(self):
+        'write_xml() writes the same XML as etree()'
+        def c14n(element):
+            return lxml.etree.tostring(element, method='c14n')
+
+        xml = ('<root version="1.0">text<item id="1">1</item><item id="2">2</item>'
+               '<x><y>3</y></x></root>')
+        for conv in (xmljson.BadgerFish(), xmljson.GData(), xmljson.Abdera(), xmljson.Cobra(),
+                     xmljson.Yahoo()):
+            data = conv.data(fromstring(xml))
+            out = io.BytesIO()
+            conv.write_xml(data, out)
+            self.assertEqual(c14n(fromstring(out.getvalue())), c14n(conv.etree(data)[0]), conv)
+            with self.assertRaises(ValueError):
+                conv.write_xml(Dict([('a', 1), ('b', 2)]), io.BytesIO())
+
+        parker = xmljson.Parker()
+        out = io.BytesIO()
+        parker.write_xml(parker.data(fromstring(xml)), out, root='root')
+        expected = parker.etree(parker.data(fromstring(xml)), root=lxml.etree.Element('root'))
+        self.assertEqual(c14n(fromstring(out.getvalue())), c14n(expected))
+
+        # records are written one at a time
+        records = xmljson.badgerfish.iterdata(os.path.join(_folder, 'GSE37019_family.xml'),
+                                              'Sample')
+        out = io.BytesIO()
+        xmljson.badgerfish.write_xml(records, out, root='Samples')
+        self.assertEqual(len(fromstring(out.getvalue()).findall('{*}Sample')), 9)
+
+
+class TestMapped(unittest.TestCase):
+    def test_mapped(self):
+        path = os.path.join(_folder, 'GSE37019_family.xml')
+        expected = xmljson.gdata.data(parse(path).getroot())
+        self.assertEqual(xmljson.gdata.data(xmljson.parse_mapped(path)), expected)
+        with io.open(path, 'rb') as handle:
+            self.assertEqual(xmljson.gdata.data(xmljson.parse_mapped(handle)), expected)
+        with xmljson.mapped(path) as source:
+            self.assertEqual(list(xmljson.gdata.iterdata(source, 'Sample')),
+                             list(xmljson.gdata.iterdata(path, 'Sample')))
+        self.assertTrue(source.closed)
+
+
+class TestStats(unittest.TestCase):
+    def test_stats(self):
+        xml = '<root a="1" b="x"><item>1</item><item>2</item><empty/></root>'
+        for cls in (xmljson.BadgerFish, xmljson.GData, xmljson.Parker, xmljson.Abdera,
+                    xmljson.Cobra, xmljson.Yahoo):
+            stats = xmljson.Stats()
+            conv = cls(stats=stats)
+            self.assertEqual(conv.data(fromstring(xml)), cls().data(fromstring(xml)))
+            self.assertEqual(stats.counts, {'elements': 4, 'attributes': 2, 'texts': 2})
+            self.assertGreater(stats.timings['convert'], 0)
+            self.assertLessEqual(stats.timings['inference'], stats.timings['convert'])
+            stats.reset()
+            self.assertEqual(stats.counts['elements'], 0)
+            # converters without stats run the class functions
+            self.assertNotIn('_walk', vars(cls()))
+
+    def test_caches_and_parse(self):
+        path = os.path.join(_folder, 'GSE37019_family.xml')
+        stats = xmljson.Stats()
+        conv = xmljson.GData(stats=stats, harmonize_synonyms=True, xml_schema=os.path.join(
+            _folder, 'MINiML.xsd'), xml_fromstring=xmljson.inference.TypeInference(64))
+        records = list(conv.iterdata(path, 'Sample'))
+        conv = xmljson.GData(harmonize_synonyms=True,
+                             xml_schema=os.path.join(_folder, 'MINiML.xsd'))
+        self.assertEqual(records, list(conv.iterdata(path, 'Sample')))
+        self.assertGreater(stats.timings['parse'], 0)
+        self.assertGreater(stats.timings['schema'], 0)
+        self.assertEqual(set(stats.caches), {'qnames', 'prefixed', 'harmonize', 'inference'})
+        hits, misses = stats.caches['qnames']
+        self.assertEqual(hits + misses, stats.counts['elements'])
+        report = stats.report()
+        self.assertIn('hit rate', report)
+        self.assertEqual(json.loads(json.dumps(stats.as_dict()))['counts'], stats.counts)
+        # worker processes (convert_parallel) get a converter without stats
+        copy = pickle.loads(pickle.dumps(conv))
+        self.assertIsNone(copy.stats)
+        self.assertNotIn('_walk', vars(copy))
+        self.assertEqual(list(copy.iterdata(path, 'Sample')), records)
+
+
+class TestLazyData(unittest.TestCase):
+    def test_lazydata(self):
+        path = os.path.join(_folder, 'GSE37019_family.xml')
+        for cls in (xmljson.BadgerFish, xmljson.GData, xmljson.Parker, xmljson.Abdera,
+                    xmljson.Cobra, xmljson.Yahoo):
+            conv = cls()
+            lazy, eager = conv.lazydata(parse(path).getroot()), conv.data(parse(path).getroot())
+            self.assertEqual(lazy, eager)
+            self.assertEqual(list(lazy), list(eager))
+
+        stats = xmljson.Stats()
+        gdata = xmljson.GData(stats=stats)
+        data = gdata.lazydata(parse(path).getroot())
+        samples = data['MINiML']['Sample']
+        self.assertIsInstance(samples[0], xmljson.LazyData)
+        self.assertEqual(samples[3]['Title']['$t'], 'embryo under C2, biological rep1')
+        converted = stats.counts['elements']
+        # only the root level and one sample are converted
+        self.assertLess(converted, 100)
+        self.assertEqual(samples[3]['Title']['$t'], 'embryo under C2, biological rep1')
+        self.assertEqual(stats.counts['elements'], converted)
+        expected = xmljson.gdata.data(parse(path).getroot())['MINiML']['Sample'][3]
+        self.assertEqual(json.dumps(samples[3].materialize()), json.dumps(expected))
+
+        self.assertEqual(xmljson.parker.lazydata(fromstring('<x><a><b>1</b></a><a>2</a></x>'),
+                                                 preserve_root=True), {'x': {'a': [{'b': 1}, 2]}})
+
+
+class TestPaths(unittest.TestCase):
+    def test_include_exclude(self):
+        xml = ('<root a="1"><x><y>1</y><z>2</z></x><x><y>3</y></x><w><v>4</v></w>'
+               '<u><t>5</t></u></root>')
+        for conv in (xmljson.BadgerFish(), xmljson.GData(), xmljson.Parker(), xmljson.Abdera(),
+                     xmljson.Cobra(), xmljson.Yahoo()):
+            def check(expected, **paths):
+                # same as converting the tree without the skipped elements
+                self.assertEqual(conv.data(fromstring(xml), **paths),
+                                 conv.data(fromstring(expected)))
+
+            check('<root a="1"><x><y>1</y></x><x><y>3</y></x></root>', include='/root/x/y')
+            check('<root a="1"><x><y>1</y></x><x><y>3</y></x><w><v>4</v></w></root>',
+                  include=['y', '//v'])
+            check('<root a="1"><x><z>2</z></x><x/></root>', include='/root/x', exclude='x/y')
+            check('<root a="1"><w><v>4</v></w><u><t>5</t></u></root>', exclude='/*/x')
+            check('<root a="1"/>', include='/other')
+        self.assertRaises(ValueError, xmljson.paths.compile_path, '/root/')
+
+    def test_iterdata(self):
+        path = os.path.join(_folder, 'GSE37019_family.xml')
+        include = ['/MINiML/Sample/Characteristics', '/MINiML/Sample/Channel']
+        root = parse(path).getroot()
+        expected = xmljson.gdata.data(root, include=include)['MINiML']['Sample']
+        self.assertEqual([set(sample) for sample in expected],
+                         [{'iid', 'Channel'}] * len(expected))
+        records = list(xmljson.gdata.iterdata(path, ('Sample', 'Series'), include=include))
+        # Series records are not selected, records are converted like document roots
+        self.assertEqual(records, [xmljson.gdata.data(sample, include=include)
+                                   for sample in root.iterchildren('{*}Sample')])
+        records = list(xmljson.gdata.iterdata(path, 'Sample', exclude='//Data-Table'))
+        self.assertEqual(len(records), len(expected))
+        self.assertTrue(all('Data-Table' not in record['Sample'] for record in records))
+
+
+class TestCompact(unittest.TestCase):
+    def test_compact(self):
+        path = os.path.join(_folder, 'GSE37019_family.xml')
+        for cls in (xmljson.BadgerFish, xmljson.GData, xmljson.Parker, xmljson.Abdera,
+                    xmljson.Cobra, xmljson.Yahoo):
+            expected = json.dumps(cls().data(parse(path).getroot()))
+            data = cls(compact=True).data(parse(path).getroot())
+            self.assertIs(type(data), dict)
+            self.assertEqual(json.dumps(data), expected)
+            data = cls(compact=True, list_type=xmljson.RecordList).data(parse(path).getroot())
+            self.assertEqual(json.dumps(data, default=xmljson.json_default), expected)
+            self.assertEqual(data, cls().data(parse(path).getroot()))
+
+    def test_etree(self):
+        'the Record items of a RecordList are converted back like dicts'
+        root = fromstring('<r><s id="1"><v>a</v></s><s id="2"><v>b</v></s><s id="3">c</s></r>')
+        for cls in (xmljson.BadgerFish, xmljson.GData, xmljson.Parker, xmljson.Abdera,
+                    xmljson.Cobra, xmljson.Yahoo):
+            conv = cls(compact=True, list_type=xmljson.RecordList)
+            expected = [tostring(elem) for elem in cls().etree(cls().data(root))]
+            self.assertEqual([tostring(elem) for elem in conv.etree(conv.data(root))], expected)
+
+    def test_record_list(self):
+        records = xmljson.RecordList([{'a': 1, 'b': 2}, {'a': 3, 'b': 4}, 'text', {'b': 5}])
+        self.assertEqual(len(records), 4)
+        self.assertIsInstance(records[1], xmljson.Record)
+        self.assertEqual(records[1]['b'], 4)
+        self.assertEqual(records, [{'a': 1, 'b': 2}, {'a': 3, 'b': 4}, 'text', {'b': 5}])
+        # the last item can still be updated until another one is appended
+        records[-1].update({'c': 6})
+        self.assertEqual(records[-1], {'b': 5, 'c': 6})
+        self.assertRaises(KeyError, lambda: records[0]['c'])
+        self.assertEqual(json.loads(json.dumps(records, default=xmljson.json_default)),
+                         [{'a': 1, 'b': 2}, {'a': 3, 'b': 4}, 'text', {'b': 5, 'c': 6}])
+        out = io.StringIO()
+        conv = xmljson.GData(list_type=xmljson.RecordList)
+        conv.dump(parse(os.path.join(_folder, 'GSE37019_family.xml')).getroot(), out)
+        self.assertEqual(out.getvalue(), json.dumps(xmljson.gdata.data(
+            parse(os.path.join(_folder, 'GSE37019_family.xml')).getroot())))
+
+
+class TestImport(unittest.TestCase):
+    # imported by import xmljson (and the command line tool) only when a converter needs them
+    deferred = ('xmlschema', 'asyncio', 'config', 'concurrent.futures', 'multiprocessing')
+
+    def imported(self, code):
+        '''Run code in a new interpreter with -X importtime, return the names of the imported
+        modules'''
+        import subprocess
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                                cwd=os.path.dirname(_folder), stderr=subprocess.PIPE,
+                                universal_newlines=True, check=True)
+        return {line.rpartition('|')[2].strip() for line in result.stderr.splitlines()
+                if line.startswith('import time:')}
+
+    def test_import(self):
+        modules = self.imported('import xmljson; assert "parker" not in vars(xmljson)')
+        self.assertIn('xmljson', modules)
+        for module in self.deferred:
+            self.assertNotIn(module, modules)
+        modules = self.imported('import xmljson, lxml.etree; '
+                                'xmljson.parker.data(lxml.etree.fromstring("<a><b>1</b></a>"))')
+        self.assertNotIn('xmlschema', modules)
+        self.assertNotIn('config', modules)
+
+    def test_cli_import(self):
+        # single file conversions do not start a worker pool
+        modules = self.imported('import xmljson.__main__')
+        self.assertIn('xmljson.__main__', modules)
+        for module in self.deferred:
+            self.assertNotIn(module, modules)
+
+    def test_deferred_import(self):
+        modules = self.imported('import xmljson; xmljson.GData(xml_schema="tests/MINiML.xsd", '
+                                'harmonize_synonyms=True)')
+        self.assertIn('xmlschema', modules)
+        self.assertIn('config', modules)
+        self.assertNotIn('asyncio', modules)
+
+    def test_default_converters(self):
+        self.assertIsInstance(xmljson.gdata, xmljson.GData)
+        self.assertIs(xmljson.gdata, xmljson.gdata)
+        from xmljson import yahoo
+        self.assertIs(yahoo, xmljson.yahoo)
+        self.assertIn('badgerfish', dir(xmljson))
+        with self.assertRaises(AttributeError):
+            xmljson.unknown
+
+
+class TestSchemaCache(unittest.TestCase):
+    xsd = os.path.join(_folder, 'MINiML.xsd')
+
+    def setUp(self):
+        import tempfile
+        self.folder = tempfile.mkdtemp()
+        self.copy = os.path.join(self.folder, 'MINiML.xsd')
+        with io.open(self.xsd, 'rb') as source, io.open(self.copy, 'wb') as target:
+            target.write(source.read())
+        xmljson.clear_schema_cache()
+
+    def tearDown(self):
+        import shutil
+        xmljson.schema_cache_dir = None
+        xmljson.clear_schema_cache()
+        shutil.rmtree(self.folder)
+
+    def test_shared(self):
+        first, second = xmljson.GData(xml_schema=self.xsd), xmljson.BadgerFish(xml_schema=self.xsd)
+        self.assertIs(first.schema_index, second.schema_index)
+        self.assertIs(first.xml_schema, second.xml_schema)
+        root = parse(os.path.join(_folder, 'GSE37019_family.xml')).getroot()
+        self.assertEqual(first.data(root), xmljson.GData(xml_schema=read('MINiML.xsd')).data(root))
+        self.assertIsNone(xmljson.GData().xml_schema)
+
+    def test_modified(self):
+        first = xmljson.GData(xml_schema=self.copy)
+        self.assertIs(xmljson.GData(xml_schema=self.copy).schema_index, first.schema_index)
+        stat = os.stat(self.copy)
+        os.utime(self.copy, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertIsNot(xmljson.GData(xml_schema=self.copy).schema_index, first.schema_index)
+
+    def test_evicted(self):
+        original = os.stat(self.copy)
+        first = xmljson.GData(xml_schema=self.copy).schema_index
+        for n in range(1, xmljson.SCHEMA_CACHE_SIZE + 1):
+            os.utime(self.copy, ns=(original.st_atime_ns, original.st_mtime_ns + n * 10 ** 9))
+            xmljson.GData(xml_schema=self.copy)
+        os.utime(self.copy, ns=(original.st_atime_ns, original.st_mtime_ns))
+        self.assertIsNot(xmljson.GData(xml_schema=self.copy).schema_index, first)
+
+    def test_directory(self):
+        xmljson.schema_cache_dir = os.path.join(self.folder, 'cache')
+        first = xmljson.GData(xml_schema=self.copy)
+        self.assertEqual(len(os.listdir(xmljson.schema_cache_dir)), 1)
+        # a new process reads the pickled index instead of parsing the XSD file
+        xmljson.clear_schema_cache()
+        second = xmljson.GData(xml_schema=self.copy)
+        self.assertIsNone(xmljson._load_schema(self.copy).xml_schema)
+        root = parse(os.path.join(_folder, 'GSE37019_family.xml')).getroot()
+        self.assertEqual(second.data(root), first.data(root))
+        self.assertEqual(sorted(second.xml_schema.elements), sorted(first.xml_schema.elements))
+        # a modified file is compiled again
+        with io.open(self.copy, 'ab') as handle:
+            handle.write(b'\n')
+        xmljson.clear_schema_cache()
+        self.assertIsNotNone(xmljson._load_schema(self.copy).xml_schema)
+
+
+class TestWriter(unittest.TestCase):
+    conventions = (xmljson.BadgerFish, xmljson.GData, xmljson.Parker, xmljson.Abdera,
+                   xmljson.Cobra, xmljson.Yahoo)
+    documents = [
+        # repeated, mixed and colliding children: tags in two namespaces with the same localname
+        '<a xmlns:x="urn:x" xmlns:y="urn:y"><x:b>1</x:b><y:b>2</y:b><c>3</c><c>4</c></a>',
+        '<a b="1"><b>2</b><c>3</c><c>true</c></a>',
+        '<a>t<b/>u<c>1</c><d>2</d><c>3</c><e x="1">z</e><f/><g>4.5</g></a>',
+        '<a><b><c>1</c><d>2</d></b><b><c>x</c></b><!-- c --><f>é "q" \\ \n</f></a>',
+        '<a/>',
+    ]
+    json_kwargs = [{}, {'indent': 2}, {'indent': '\t', 'ensure_ascii': False},
+                   {'separators': (',', ':')}]
+
+    def check(self, conv, load, **kwargs):
+        expected = json.dumps(conv.data(load()), default=xmljson.json_default, **kwargs)
+        self.assertEqual(conv.dumps(load(), **kwargs), expected)
+        out = io.StringIO()
+        conv.dump(load(), out, **kwargs)
+        self.assertEqual(out.getvalue(), expected)
+
+    def test_dump(self):
+        paths = [os.path.join(_folder, path) for path in ('abdera-1.xml', 'abdera-3.xml',
+                                                          'GSE37019_family.xml')]
+        for cls in self.conventions:
+            for options in ({}, {'compact': True, 'list_type': xmljson.RecordList}):
+                conv = cls(**options)
+                for kwargs in self.json_kwargs:
+                    for path in paths:
+                        self.check(conv, lambda: parse(path).getroot(), **kwargs)
+                    for document in self.documents:
+                        self.check(conv, lambda: fromstring(document), **kwargs)
+
+    def test_schema(self):
+        path = os.path.join(_folder, 'GSE37019_family.xml')
+        for cls in self.conventions:
+            conv = cls(xml_schema=os.path.join(_folder, 'MINiML.xsd'))
+            self.check(conv, lambda: parse(path).getroot(), indent=2)
+
+    def test_fallback(self):
+        # json.dump arguments the writer does not support and harmonized data
+        path = os.path.join(_folder, 'GSE37019_family.xml')
+        self.check(xmljson.GData(), lambda: parse(path).getroot(), sort_keys=True)
+        self.check(xmljson.GData(harmonize_synonyms=True), lambda: parse(path).getroot())
+
+    def test_ndjson(self):
+        path = os.path.join(_folder, 'GSE37019_family.xml')
+        lines = list(xmljson.gdata.ndjson(path, 'Sample'))
+        self.assertEqual(lines, [json.dumps(data, separators=(',', ':')) + '\n'
+                                 for data in xmljson.gdata.iterdata(path, 'Sample')])
+
+
+class TestGrouping(unittest.TestCase):
+    def test_grouped_children(self):
+        root = fromstring('<a><b>1</b><!-- c --><c/><b>2</b><?pi x?><d/><b>3</b></a>')
+        children, tags, counts = xmljson.XMLData._grouped_children(root, xmljson._Context())
+        self.assertEqual(tags, ['b', 'c', 'b', 'd', 'b'])
+        self.assertEqual([child.tag for child in children], tags)
+        self.assertEqual(dict(counts), {'b': 3, 'c': 1, 'd': 1})
+        skipped = xmljson._Context(skipped={children[0], children[1]})
+        children, tags, counts = xmljson.XMLData._grouped_children(root, skipped)
+        self.assertEqual(tags, ['b', 'd', 'b'])
+        self.assertEqual(dict(counts), {'b': 2, 'd': 1})
+
+    def test_repeated(self):
+        # thousands of repeated siblings around single children, in document order
+        items = ''.join('<x:b>%d</x:b><c>%d</c>' % (i, i) for i in range(1, 2001))
+        root = fromstring('<a xmlns:x="urn:x"><d>0</d>%s<!-- e --><e/></a>' % items)
+        expected = list(range(1, 2001))
+        self.assertEqual(xmljson.parker.data(root)['b'], expected)
+        self.assertEqual(xmljson.Parker(ns_as_prefix=True).data(root)['{urn:x}b'], expected)
+        data = xmljson.badgerfish.data(root)['a']
+        self.assertEqual(list(data), ['d', 'b', 'c', 'e'])
+        self.assertEqual([item['$'] for item in data['b']], expected)
+        prefixed = xmljson.BadgerFish(ns_as_prefix=True).data(root)['a']
+        self.assertEqual(prefixed['x:b'][-1]['$'], 2000)
+        children = xmljson.cobra.data(root)['a']['children']
+        self.assertEqual(len(children), 4001)
+        self.assertEqual(children[-1], {'c': '2000', 'e': {'attributes': {}}})
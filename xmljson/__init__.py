@@ -1,11 +1,24 @@
 # -*- coding: utf-8 -*-
-import re
+import copy
+import os
+import json
+import mmap
 import sys
 from collections import Counter, OrderedDict
-from io import BytesIO
-import config
+from collections.abc import Mapping
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from io import BytesIO, StringIO
+from types import MappingProxyType
 import lxml.etree as ET
-import xmlschema
+from . import harmonize, inference
+from .containers import Record, RecordList, json_default  # noqa: F401 (public names)
+from .paths import PathFilter
+from .stats import Stats  # noqa: F401 (public as xmljson.Stats)
+from .writer import BUFFER_PARTS, JSONWriter
+
+# xmlschema, asyncio, concurrent.futures and config (the synonym tables) are imported where they
+# are needed: import xmljson stays fast for command line tools and cold starts that do not use them
 
 # This fork does only work with lxml.etree
 # to make it work with xml.etree adjustments have to made: i.e. splitting into ns-prefix and tag has to be done
@@ -29,24 +42,529 @@ if sys.version_info[0] == 3:
     basestring = str
 
 
+def _keep_string(value):
+    return value
+
+
+def _schema_string(content):
+    return str(content.rstrip())
+
+
+def _schema_int(content):
+    return int(content.rstrip())
+
+
+def _schema_bool(content):
+    return bool(content.rstrip())
+
+
+def _schema_none(content):
+    return None
+
+
+# map XSD simple types (by their repr) to json types, types not listed are converted to None
+_schema_converters = {
+    "XsdAtomicBuiltin(name='xs:ID')": _schema_string,
+    "XsdAtomicBuiltin(name='xs:string')": _schema_string,
+    "XsdAtomicBuiltin(name='xs:normalizedString')": _schema_string,
+    "XsdAtomicBuiltin(name='xs:date')": _schema_string,
+    "XsdAtomicBuiltin(name='xs:time')": _schema_string,
+    "XsdAtomicBuiltin(name='xs:anyURI')": _schema_string,
+    "XsdAtomicBuiltin(name='xs:token')": _schema_string,
+    "XsdAtomicBuiltin(name='xs:IDREF')": _schema_string,
+    "XsdAtomicBuiltin(name='xs:NCName')": _schema_string,
+    "XsdAtomicBuiltin(name='xs:positiveInteger')": _schema_int,
+    "XsdAtomicBuiltin(name='xs:nonNegativeInteger')": _schema_int,
+    "XsdAtomicBuiltin(name='xs:integer')": _schema_int,
+    "XsdAtomicBuiltin(name='xs:boolean')": _schema_bool,
+}
+
+
+def _schema_converter(xsd_type):
+    '''Return the function that converts content of xsd_type to its json type'''
+    return _schema_converters.get(str(xsd_type), _schema_none)
+
+
+def _normalize_synonym(name):
+    '''Lower case name and collapse its whitespace. Values that are not strings (e.g. attributes
+    typed by a schema) are returned unchanged.'''
+    if not isinstance(name, basestring):
+        return name
+    return ' '.join(name.split()).lower()
+
+
+@lru_cache(maxsize=32)
+def _compile_synonyms(synonyms=(), normalize=False):
+    '''Compile the synonym lists in config.py and synonyms, a tuple of (synonym, harmonized tag)
+    pairs that take precedence, into one frozen dict {synonym: harmonized tag}.
+    Like before, a synonym listed more than once in config.py maps to the first list.'''
+    import config
+    table = {}
+    pairs = list(synonyms)
+    for names, harmonized in (config.harmonize_as_age_raw, config.harmonize_as_genotype_raw,
+                              config.harmonize_as_treatment_raw):
+        pairs.extend((name, harmonized) for name in names)
+    for name, harmonized in pairs:
+        table.setdefault(_normalize_synonym(name) if normalize else name, harmonized)
+    return MappingProxyType(table)
+
+
+class SchemaNode(object):
+    '''Compiled schema information of one element declaration'''
+    __slots__ = ('text', 'attributes', 'children')
+
+    def __init__(self):
+        # converter for text content, None if the element has no simple content
+        self.text = None
+        # attribute name -> converter. Attributes not declared in the schema are dropped
+        self.attributes = {}
+        # child tag -> SchemaNode
+        self.children = {}
+
+
+class SchemaIndex(object):
+    '''Element paths of an xmlschema.XMLSchema compiled to converters.
+    Compiled once, the index only holds plain dicts and module level functions, so it can be
+    pickled and shared with worker processes. Looking up a child of a known element is a single
+    dict lookup instead of a search through the schema.'''
+
+    def __init__(self, xml_schema):
+        # tag (and localname) of global elements -> SchemaNode
+        self.roots = {}
+        compiled = {}
+        for name, xsd_element in xml_schema.elements.items():
+            node = self._compile(xsd_element, compiled)
+            self.roots.setdefault(xsd_element.name, node)
+            self.roots.setdefault(name, node)
+
+    @classmethod
+    def _compile(cls, xsd_element, compiled):
+        # references share the node of the global element, one node per declaration
+        # also terminates recursive schemas
+        xsd_element = getattr(xsd_element, 'ref', None) or xsd_element
+        if id(xsd_element) in compiled:
+            return compiled[id(xsd_element)]
+        node = compiled[id(xsd_element)] = SchemaNode()
+        xsd_type = xsd_element.type
+        simple_type = xsd_type.simple_type
+        if simple_type:
+            node.text = _schema_converter(simple_type.base_type or simple_type)
+        for name, xsd_attribute in getattr(xsd_type, 'attributes', {}).items():
+            # skip attribute wildcards
+            if name is not None and xsd_attribute.type is not None:
+                node.attributes[name] = _schema_converter(xsd_attribute.type.base_type)
+        for xsd_child in xsd_element:
+            # skip element wildcards and names declared twice (the first one wins)
+            if xsd_child.name is not None and xsd_child.name not in node.children:
+                node.children[xsd_child.name] = cls._compile(xsd_child, compiled)
+        return node
+
+    def lookup(self, path):
+        '''Return the SchemaNode for a sequence of tags starting at a global element, or None'''
+        path = iter(path)
+        tag = next(path)
+        node = self.roots.get(tag) or self.roots.get(ET.QName(tag).localname)
+        for tag in path:
+            if node is None:
+                break
+            node = node.children.get(tag)
+        return node
+
+    def wrapped(self, wrap):
+        '''Return a copy of the index with every converter replaced by wrap(converter)'''
+        index = copy.deepcopy(self)
+        wrappers = {}
+
+        def rewrap(func):
+            if func not in wrappers:
+                wrappers[func] = wrap(func)
+            return wrappers[func]
+
+        seen, stack = set(), list(index.roots.values())
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            if node.text is not None:
+                node.text = rewrap(node.text)
+            node.attributes = {name: rewrap(func) for name, func in node.attributes.items()}
+            stack.extend(node.children.values())
+        return index
+
+
+# number of compiled schemas kept per process, see _load_schema
+SCHEMA_CACHE_SIZE = 16
+# directory for compiled schemas pickled for later processes (CLI calls, batch workers), None to
+# compile every schema once per process. Defaults to the XMLJSON_SCHEMA_CACHE environment variable
+schema_cache_dir = os.environ.get('XMLJSON_SCHEMA_CACHE') or None
+# changes when SchemaIndex changes, pickled indexes of other versions are compiled again
+_SCHEMA_CACHE_FORMAT = (__version__, 1)
+
+
+class _CachedSchema(object):
+    '''Compiled schema of one version of an XSD file'''
+    __slots__ = ('path', 'index', 'xml_schema')
+
+    def __init__(self, path, index, xml_schema=None):
+        self.path = path
+        self.index = index
+        # None if the index was read from schema_cache_dir
+        self.xml_schema = xml_schema
+
+    def schema(self):
+        '''Return the xmlschema.XMLSchema, the XSD file is parsed on first use'''
+        if self.xml_schema is None:
+            import xmlschema
+            self.xml_schema = xmlschema.XMLSchema(self.path)
+        return self.xml_schema
+
+
+def _load_schema(path):
+    '''Return the _CachedSchema of the XSD file path. Schemas are compiled once per process and
+    version of the file: the cache is keyed by resolved path, modification time and size and holds
+    the SCHEMA_CACHE_SIZE most recently used schemas. Files imported or included by the XSD file
+    are not checked for changes.'''
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    return _cached_schema(path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=SCHEMA_CACHE_SIZE)
+def _cached_schema(path, mtime, size):
+    directory = schema_cache_dir
+    if directory:
+        index = _read_schema_index(directory, path, (mtime, size))
+        if index is not None:
+            return _CachedSchema(path, index)
+    import xmlschema
+    xml_schema = xmlschema.XMLSchema(path)
+    index = SchemaIndex(xml_schema)
+    if directory:
+        _write_schema_index(directory, path, (mtime, size), index)
+    return _CachedSchema(path, index, xml_schema)
+
+
+def clear_schema_cache():
+    '''Forget the schemas compiled by this process, pickled ones in schema_cache_dir are kept'''
+    _cached_schema.cache_clear()
+
+
+def _schema_cache_file(directory, path):
+    import hashlib
+    return os.path.join(directory, hashlib.sha1(path.encode('utf-8')).hexdigest() + '.pickle')
+
+
+def _read_schema_index(directory, path, stamp):
+    '''Return the SchemaIndex pickled for this version of path, None if there is none'''
+    import pickle
+    try:
+        with open(_schema_cache_file(directory, path), 'rb') as handle:
+            version, cached_path, cached_stamp, index = pickle.load(handle)
+    except Exception:
+        # missing, unreadable or written by another version
+        return None
+    if (version, cached_path, cached_stamp) != (_SCHEMA_CACHE_FORMAT, path, stamp):
+        return None
+    return index
+
+
+def _write_schema_index(directory, path, stamp, index):
+    '''Pickle index for later processes. Written to a temporary file that replaces the old one,
+    so concurrent processes never read a partial file. The cache is optional, errors are
+    ignored.'''
+    import pickle
+    import tempfile
+    try:
+        os.makedirs(directory, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as out:
+                pickle.dump((_SCHEMA_CACHE_FORMAT, path, stamp, index), out,
+                            pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, _schema_cache_file(directory, path))
+        except BaseException:
+            os.remove(temporary)
+            raise
+    except (OSError, pickle.PicklingError):
+        pass
+
+
+class _Context(object):
+    '''State of one conversion call. Converters keep no state of their own while converting,
+    so one converter can convert many documents, also concurrently from several threads.'''
+    __slots__ = ('is_doc_root', 'age', 'age_unit', 'duration', 'duration_unit', 'qnames', 'scopes',
+                 'prefixed', 'skipped')
+
+    def __init__(self, is_doc_root=True, skipped=None):
+        # True if root element hasn't been visited
+        self.is_doc_root = is_doc_root
+        # elements that are not converted (see PathFilter.skipped), None to convert all
+        self.skipped = skipped
+        # last age and treatment duration parsed by _harmonize_content
+        self.age = self.age_unit = None
+        self.duration = self.duration_unit = None
+        # namespace cache: tag -> (localname, uri), nsmap items -> scope id,
+        # (tag, scope id) -> tag prefixed by convention (see XMLData._qname, _scope, _prefixed)
+        self.qnames = {}
+        self.scopes = {}
+        self.prefixed = {}
+
+
+# json.dump arguments that the writer of XMLData.dump supports
+_writer_options = frozenset(('indent', 'separators', 'ensure_ascii'))
+# text of an element that has no text in its data
+_NO_TEXT = object()
+
+
+def _declares_namespaces(element):
+    '''True if element has xmlns attributes (see XMLData.parse_nsmap), _process_ns changes it'''
+    return any(key.split(':')[0] == 'xmlns' for key in element.attrib.keys())
+
+
+class _Deferred(object):
+    '''Placeholder for the data of element, converted when it is JSON encoded.
+    key is the key that wraps the element data, None if it is not wrapped (Parker)'''
+    __slots__ = ('element', 'key')
+
+    def __init__(self, element, key):
+        self.element = element
+        self.key = key
+
+
+class _Deferral(object):
+    '''Pre-converted elements for _walk that defers all children of root'''
+
+    def __init__(self, conv, root):
+        self.conv = conv
+        self.root = root
+
+    def __contains__(self, element):
+        return element.getparent() is self.root
+
+    def __getitem__(self, element):
+        return self.conv._defer(element)
+
+
+class _Laziness(_Deferral):
+    '''Pre-converted elements for _walk that makes the children of root LazyData.
+    Children without child elements are converted right away, some conventions convert them to
+    scalars (e.g. Parker text), all others convert to a dict.'''
+
+    def __init__(self, conv, root, context):
+        super(_Laziness, self).__init__(conv, root)
+        self.context = context
+
+    def __contains__(self, element):
+        return (element.getparent() is self.root and
+                next(element.iterchildren(ET.Element), None) is not None)
+
+    def __getitem__(self, element):
+        return self.conv._defer(element, partial(LazyData, self.conv, self.context))
+
+
+class LazyData(Mapping):
+    '''Read-only mapping with the data of an element, returned by XMLData.lazydata().
+    The element is converted when the mapping is first accessed, its children with child
+    elements are LazyData again. Keys and values are the ones data() returns.'''
+    __slots__ = ('_conv', '_context', '_element', '_key', '_data')
+
+    def __init__(self, conv, context, element, key):
+        self._conv = conv
+        self._context = context
+        self._element = element
+        # key that wraps the element data, None if it is not wrapped (Parker)
+        self._key = key
+        self._data = None
+
+    def _value(self):
+        if self._data is None:
+            conv, element = self._conv, self._element
+            data = conv._walk(element, conv._schema_node(element),
+                              _Laziness(conv, element, self._context), self._context)
+            self._data = data if self._key is None else data[self._key]
+        return self._data
+
+    def __getitem__(self, key):
+        return self._value()[key]
+
+    def __iter__(self):
+        return iter(self._value())
+
+    def __len__(self):
+        return len(self._value())
+
+    def __repr__(self):
+        return '<LazyData of %s>' % self._element.tag
+
+    def materialize(self):
+        '''Return the data as data() returns it, with nothing left to convert'''
+        conv, element = self._conv, self._element
+        data = conv._walk(element, conv._schema_node(element), context=self._context)
+        return data if self._key is None else data[self._key]
+
+
+def _memo_hits(stats, cache, func, cache_info):
+    '''Return func, counting in stats whether its calls hit the lru_cache with cache_info'''
+    def counted(*args):
+        hits = cache_info().hits
+        result = func(*args)
+        stats.hit(cache, cache_info().hits > hits)
+        return result
+    return counted
+
+
+def _nested_record(elem, tags):
+    '''True if elem is inside an element with one of tags, a record that is still open.
+    It is converted with that record and must not be freed before it.'''
+    return next(elem.iterancestors(*tags), None) is not None
+
+
+def _free_record(elem):
+    '''Clear a converted record and all siblings that have been parsed before it'''
+    elem.clear(keep_tail=True)
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+class _Records(object):
+    '''Record elements of a document that is fed in chunks to an lxml XMLPullParser.
+    feed() and close() return an iterator over the records that have been closed by the data, every
+    record is freed (see _free_record) when the iterator moves on to the next one.'''
+
+    def __init__(self, record_tag, **kwargs):
+        self.tags = XMLData._record_tags(record_tag)
+        self.parser = ET.XMLPullParser(events=('end',), tag=self.tags, **kwargs)
+
+    def feed(self, data):
+        self.parser.feed(data)
+        return self._records()
+
+    def close(self):
+        self.parser.close()
+        return self._records()
+
+    def _records(self):
+        for event, elem in self.parser.read_events():
+            if _nested_record(elem, self.tags):
+                continue
+            yield elem
+            _free_record(elem)
+
+
+class Feeder(object):
+    '''Converts a document that is fed chunk by chunk, e.g. as it arrives from a socket.
+    Created by XMLData.feeder(), see there.'''
+
+    def __init__(self, converter, record_tag=None, **kwargs):
+        self.converter = converter
+        if record_tag is None:
+            self._parser, self._records = ET.XMLPullParser(**kwargs), None
+        else:
+            self._parser, self._records = None, _Records(record_tag, **kwargs)
+
+    def feed(self, data):
+        '''Parse data (bytes or str), return the list of records it completes'''
+        if self._records is None:
+            self._parser.feed(data)
+            return []
+        return [self.converter.data(elem) for elem in self._records.feed(data)]
+
+    def close(self):
+        '''Finish parsing, return the list of remaining records (the whole document without
+        record_tag). Raises lxml.etree.XMLSyntaxError if the document is incomplete.'''
+        if self._records is None:
+            return [self.converter.data(self._parser.close())]
+        return [self.converter.data(elem) for elem in self._records.close()]
+
+
+async def _achunks(source, chunk_size):
+    '''Iterate over the chunks of source: bytes or str, a file-like object with a read(size)
+    function or coroutine (e.g. aiohttp StreamReader), or an (async) iterable of chunks'''
+    import asyncio
+    if isinstance(source, (bytes, basestring)):
+        yield source
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if asyncio.iscoroutine(chunk):
+                chunk = await chunk
+            if not chunk:
+                break
+            yield chunk
+    elif hasattr(source, '__aiter__'):
+        async for chunk in source:
+            yield chunk
+    else:
+        for chunk in source:
+            yield chunk
+
+
+def _check_executor(executor):
+    '''Raise ValueError for a process pool: lxml elements cannot be pickled to its workers'''
+    if executor is not None:
+        from concurrent.futures import ProcessPoolExecutor
+        if isinstance(executor, ProcessPoolExecutor):
+            raise ValueError('executor must be a thread pool, lxml elements cannot be pickled, '
+                             'use convert_parallel() to convert in processes')
+
+
+@contextmanager
+def mapped(file):
+    '''Memory-map file (a path or a file object with a fileno()) read-only, e.g.
+
+        with mapped('GSE179926_family.xml') as source:
+            root = lxml.etree.fromstring(source)        # whole document, no copy to bytes
+            records = list(gdata.iterdata(source, 'Sample'))   # or iterparse mode
+
+    lxml.etree.fromstring (and parse_mapped) parses the pages of the map directly instead of a
+    copy read through Python file reads, and the pages stay in the OS page cache for later runs.
+    iterparse (iterdata, ndjson) calls read() on the map like on a file, which copies the data
+    through Python: there the map is not faster than the file.
+    Empty files and pipes cannot be mapped.'''
+    if hasattr(file, 'fileno'):
+        source = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    else:
+        with open(file, 'rb') as handle:
+            source = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield source
+    finally:
+        source.close()
+
+
+def parse_mapped(file, parser=None):
+    '''Parse file (a path or a file object) through a memory map, return the root element'''
+    with mapped(file) as source:
+        return ET.fromstring(source, parser)
+
+
 class XMLData(object):
     def __init__(self, xml_fromstring=True, xml_tostring=True, element=None, dict_type=None,
-                 list_type=None, attr_prefix=None, text_content=None, simple_text=False, ns_name=None,
-                 ns_as_attrib=None, ns_as_prefix=None, invalid_tags=None, xml_schema=None, conv=None, harmonize_synonyms=False):
+                 list_type=None, attr_prefix=None, text_content=None, simple_text=False,
+                 ns_name=None, ns_as_attrib=None, ns_as_prefix=None, invalid_tags=None,
+                 xml_schema=None, conv=None, harmonize_synonyms=False, synonyms=None,
+                 normalize_synonyms=False, stats=None, compact=False):
         # xml_fromstring == False(y) => '1' -> '1'
         # xml_fromstring == True     => '1' -> 1
+        # xml_fromstring == inference.TypeInference(cache_size=4096) => '1' -> 1, caches values
         if callable(xml_fromstring):
             self._fromstring = xml_fromstring
         elif not xml_fromstring:
-            self._fromstring = lambda v: v
+            self._fromstring = _keep_string
         # custom conversion function to convert data string to XML string
         if callable(xml_tostring):
             self._tostring = xml_tostring
         # custom etree.Element to use
         self.element = Element if element is None else element
         # dict constructor (e.g. OrderedDict, defaultdict)
-        self.dict = OrderedDict if dict_type is None else dict_type
-        # list constructor (e.g. UserList)
+        # compact == True => plain dicts, they keep the insertion order and take less memory
+        if dict_type is None:
+            dict_type = dict if compact else OrderedDict
+        self.dict = dict_type
+        # list constructor (e.g. UserList, xmljson.RecordList to store repeated children as tuples)
         self.list = list if list_type is None else list_type
         # Prefix attributes with a string (e.g. '@')
         self.attr_prefix = attr_prefix
@@ -63,17 +581,6 @@ class XMLData(object):
         # True if Names should be prefixed by namespace (default False)
         self.ns_as_prefix = ns_as_prefix
 
-        # True if root element hasn't been visited
-        self.is_doc_root = True
-
-        # store current root of schema sub tree in which we look for schema_element
-        self.root_schema_element = None
-        # store the current schema element
-        self.schema_element = None
-        # used for schema traversal / remembering position in schema
-        self.schema_stack = []
-        self.schema_attribute_stack = []
-
         self.lxml_lib = True
 
         # used to identify convention
@@ -82,17 +589,32 @@ class XMLData(object):
         #use if synoyms are to be harmonized -> synonyms to be harmonized can be specified in config.py
         # cleaning of element content is only implemented for Badgerfish and GData
         self.harmonize_synonyms = harmonize_synonyms
+        # synonyms: additional {synonym: harmonized tag} table, overrides config.py
+        # normalize_synonyms == True => synonyms match ignoring case and repeated whitespace
+        self.normalize_synonyms = normalize_synonyms
+        if harmonize_synonyms:
+            self._synonyms = _compile_synonyms(tuple((synonyms or {}).items()), normalize_synonyms)
         #names used for harmonized data
         self.original_data_name = "original_data"
         self.raw_data_name = "raw_data"
 
-
-        #  use schema to infer type / only works for Abdera, Badgerfish, Gdata and Parker
+        #  use schema to infer type / not used by Yahoo
+        # XMLSchema object, for XSD files loaded when xml_schema is first read, see _load_schema
+        self._xml_schema = None
+        self._xml_schema_path = None
         if xml_schema is None:
             self.schema_typing = False
+        elif isinstance(xml_schema, basestring) and os.path.isfile(xml_schema):
+            # XSD files are compiled once per process and file version, converters share the index
+            self._xml_schema_path = xml_schema
+            self.schema_index = _load_schema(xml_schema).index
+            self.schema_typing = True
         else:
-            # pass XML schema location as string, create XMLSchema Object with it
-            self.xml_schema = xmlschema.XMLSchema(xml_schema)
+            # other schema sources (URLs, file objects, XSD text) are not cached
+            import xmlschema
+            self._xml_schema = xmlschema.XMLSchema(xml_schema)
+            # compile converters for all element paths once, lookups during conversion are O(1)
+            self.schema_index = SchemaIndex(self._xml_schema)
             self.schema_typing = True
 
         # invalid_tags == 'drop' => tags like $ are ignored
@@ -102,6 +624,101 @@ class XMLData(object):
         elif invalid_tags is not None:
             raise TypeError('invalid_tags can be "drop" or None, not "%s"' % invalid_tags)
 
+        # stats == xmljson.Stats() => record time per phase, counts and cache hits, see _instrument
+        self.stats = stats
+        if stats is not None:
+            self._instrument(stats)
+
+    def __getstate__(self):
+        # the compiled schema_index is all a converter needs,
+        # do not copy the XMLSchema object to worker processes
+        state = self.__dict__.copy()
+        state['_xml_schema'] = None
+        if self.stats is not None:
+            # worker processes convert without stats
+            for name in state.pop('_instrumented'):
+                del state[name]
+            state.update(state.pop('_uninstrumented'))
+            state['stats'] = None
+        if '_synonyms' in state:
+            # mappingproxy cannot be pickled
+            state['_synonyms'] = dict(state['_synonyms'])
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if '_synonyms' in state:
+            self._synonyms = MappingProxyType(state['_synonyms'])
+
+    @property
+    def xml_schema(self):
+        '''The xmlschema.XMLSchema of xml_schema=, None without schema'''
+        if self._xml_schema is None and self._xml_schema_path is not None:
+            self._xml_schema = _load_schema(self._xml_schema_path).schema()
+        return self._xml_schema
+
+    # functions replaced by _instrument, by the phase they are timed as
+    _phases = {
+        'convert': ('_walk', '_write_walk'),
+        'namespaces': ('_process_namespace', '_process_ns', '_qname', '_scope', '_prefixed'),
+        'schema': ('_schema_node', '_typemapping'),
+        'inference': ('_fromstring',),
+        'harmonize': ('_harmonize_tag', '_harmonize_content'),
+    }
+
+    def _instrument(self, stats):
+        '''Shadow the functions of every conversion phase with instance attributes that record
+        stats: time per phase, element, attribute and text counts and cache hits.
+        Converters without stats keep the class functions, so they pay nothing for this.'''
+        qname, prefixed = self._qname, self._prefixed
+
+        def counted(node):
+            # _node and _write_node frames
+            def counted_node(root, *args):
+                counts = stats.counts
+                counts['elements'] += 1
+                counts['attributes'] += len(root.attrib)
+                if root.text and root.text.strip():
+                    counts['texts'] += 1
+                return node(root, *args)
+            return counted_node
+
+        def _qname(tag, context):
+            stats.hit('qnames', tag in context.qnames)
+            return qname(tag, context)
+
+        def _prefixed(tag, nsmap, scope, context):
+            stats.hit('prefixed', (tag, scope) in context.prefixed)
+            return prefixed(tag, nsmap, scope, context)
+
+        functions = {'_node': counted(self._node), '_write_node': counted(self._write_node),
+                     '_qname': _qname, '_prefixed': _prefixed}
+        # memoized harmonization parsers and TypeInference(cache_size=...)
+        memos = [('harmonize', 'parse_for_hpf', harmonize.parse_for_hpf),
+                 ('harmonize', 'parse_for_concentration_and_compound',
+                  harmonize._concentration_and_compound),
+                 ('harmonize', 'parse_for_exposure_duration',
+                  harmonize.parse_for_exposure_duration),
+                 ('inference', '_fromstring', getattr(self._fromstring, '_infer', None))]
+        for cache, name, memo in memos:
+            if hasattr(memo, 'cache_info'):
+                functions[name] = _memo_hits(stats, cache, getattr(self, name), memo.cache_info)
+        instrumented = {}
+        for phase, names in self._phases.items():
+            for name in names:
+                instrumented[name] = stats.timed(phase, functions.get(name) or getattr(self, name))
+        for name in ('_node', '_write_node', 'parse_for_hpf',
+                     'parse_for_concentration_and_compound', 'parse_for_exposure_duration'):
+            instrumented.setdefault(name, functions.get(name) or getattr(self, name))
+        if self.schema_typing:
+            instrumented['schema_index'] = self.schema_index.wrapped(
+                lambda func: stats.timed('schema', func))
+
+        self._instrumented = tuple(instrumented)
+        self._uninstrumented = {name: self.__dict__[name] for name in instrumented
+                                if name in self.__dict__}
+        self.__dict__.update(instrumented)
+
     def _make_valid_element(self, key):
         try:
             return self._element(key)
@@ -124,93 +741,301 @@ class XMLData(object):
     @staticmethod
     def _typemapping(content, xsd_type):
         '''Convert content to json types according to specified mapping of xsd_simpletype'''
+        return _schema_converter(xsd_type)(content)
+
+    # Convert XML string value to None, boolean, int or float, see xmljson.inference
+    _fromstring = staticmethod(inference.infer_type)
 
-        convert_to_string = ["XsdAtomicBuiltin(name='xs:ID')", "XsdAtomicBuiltin(name='xs:string')",
-                             "XsdAtomicBuiltin(name='xs:normalizedString')",
-                             "XsdAtomicBuiltin(name='xs:date')", "XsdAtomicBuiltin(name='xs:time')",
-                             "XsdAtomicBuiltin(name='xs:anyURI')", "XsdAtomicBuiltin(name='xs:token')",
-                             "XsdAtomicBuiltin(name='xs:IDREF')", "XsdAtomicBuiltin(name='xs:NCName')"]
-        convert_to_int = ["XsdAtomicBuiltin(name='xs:positiveInteger')",
-                          "XsdAtomicBuiltin(name='xs:nonNegativeInteger')",
-                          "XsdAtomicBuiltin(name='xs:integer')"]
-        convert_to_bool = ["XsdAtomicBuiltin(name='xs:boolean')"]
-
-        if str(xsd_type) is None:
-            return str(content.rstrip())
-        if str(xsd_type) in convert_to_string:
-            return str(content.rstrip())
-        if str(xsd_type) in convert_to_int:
-            return int(content.rstrip())
-        if str(xsd_type) in convert_to_bool:
-            return bool(content.rstrip())
+    def data(self, root, include=None, exclude=None):
+        '''Convert etree.Element into a dictionary.
+        include and exclude are paths (see xmljson.paths) or sequences of them that select the
+        elements to convert, e.g. include='/MINiML/Sample/Characteristics'. Elements that are
+        not selected are skipped without being converted, as if they were not in the tree.'''
+        context = self._select(root, include, exclude)
+        return self._walk(root, self._schema_node(root), context=context)
+
+    def lazydata(self, root):
+        '''Like data(), but children of root that have child elements are LazyData mappings,
+        converted (once) when they are accessed, e.g. to read a few fields of a large document.
+        root must not be modified while LazyData of it is in use. With harmonize_synonyms, the
+        result depends on the order elements are converted in, so everything is converted.'''
+        if self.harmonize_synonyms:
+            return self._walk(root, self._schema_node(root))
+        context = _Context()
+        return self._walk(root, self._schema_node(root), _Laziness(self, root, context), context)
+
+    def _walk(self, root, schema, converted=None, context=None):
+        '''Convert root (with compiled SchemaNode schema) and all its descendants.
+        Frames are generators (see _node) that yield the child elements they need converted and
+        receive the converted data back. They are kept on an explicit stack instead of the call
+        stack, so deeply nested documents do not hit the recursion limit.
+        converted maps elements that have been converted in advance to their data.
+        context is the _Context of the conversion call, a new one by default.'''
+        context = _Context() if context is None else context
+        stack = [self._node(root, schema, context)]
+        schemas = [schema]
+        data = None
+        while stack:
+            try:
+                child = stack[-1].send(data)
+            except StopIteration as done:
+                stack.pop()
+                schemas.pop()
+                data = done.value
+            else:
+                if converted is not None and child in converted:
+                    data = converted[child]
+                    continue
+                schema = schemas[-1] and schemas[-1].children.get(child.tag)
+                stack.append(self._node(child, schema, context))
+                schemas.append(schema)
+                data = None
+        return data
+
+    def _schema_node(self, element):
+        '''Return the compiled SchemaNode for element (looked up by its path from the document
+        root), or None if schema typing is not used or the schema does not declare element'''
+        if not self.schema_typing:
+            return None
+        return self.schema_index.lookup(self._path(element))
 
     @staticmethod
-    def _fromstring(value):
-        '''Convert XML string value to None, boolean, int or float'''
+    def _children(root, context):
+        '''Return the child elements of root that are converted'''
+        children = [node for node in root if isinstance(node.tag, basestring)]
+        if context.skipped is not None:
+            children = [child for child in children if child not in context.skipped]
+        return children
 
-        # NOTE: Is this even possible ?
-        if value is None:
+    @staticmethod
+    def _grouped_children(root, context):
+        '''Return (children, tags, counts) for the child elements of root that are converted (see
+        _children): the children, their tags and tag -> number of children with the tag.
+        lxml creates a new string whenever a tag is read, every tag is read once.'''
+        children = list(root)
+        if not children:
+            return children, [], {}
+        tags = [child.tag for child in children]
+        if len(tags) == 1 and context.skipped is None and isinstance(tags[0], basestring):
+            # single children, without the cost of a Counter
+            return children, tags, {tags[0]: 1}
+        counts = Counter(tags)
+        if context.skipped is not None or not all(isinstance(tag, basestring) for tag in counts):
+            # comments, processing instructions and skipped elements are not converted
+            skipped = context.skipped or ()
+            pairs = [(child, tag) for child, tag in zip(children, tags)
+                     if isinstance(tag, basestring) and child not in skipped]
+            children = [child for child, _ in pairs]
+            tags = [tag for _, tag in pairs]
+            counts = Counter(tags)
+        return children, tags, counts
+
+    @classmethod
+    def _select(cls, root, include, exclude):
+        '''Return the _Context of a conversion of root that skips the elements include and
+        exclude do not select, None to convert all elements'''
+        if include is None and exclude is None:
             return None
+        paths = PathFilter(include, exclude)
+        return _Context(skipped=paths.skipped(root, paths.state(cls._path(root))))
 
-        # FIXME: In XML, booleans are either 0/false or 1/true (lower-case !)
-        if value.lower() == 'true':
-            return True
-        elif value.lower() == 'false':
-            return False
+    def _key(self, element):
+        '''Return the key that wraps the data of element'''
+        if not self.ns_as_prefix:
+            return ET.QName(element).localname
+        return self._uri_to_prefix(element.tag, element.nsmap)
 
-        # FIXME: Using int() or float() is eating whitespaces unintendedly here
-        # why value.lower()? => makes test case fail cause 0.0M gets 0.0m for example
-        try:
+    @staticmethod
+    def _qname(tag, context):
+        '''Return (localname, namespace uri) of tag, parsed once per conversion call'''
+        qname = context.qnames.get(tag)
+        if qname is None:
+            parsed = ET.QName(tag)
+            qname = context.qnames[tag] = (parsed.localname, parsed.namespace)
+        return qname
 
-            if value.lower().startswith('0'):
-                return value
-            else:
-                return int(value.lower())
-        except ValueError:
-            pass
+    @staticmethod
+    def _scope(nsmap, context):
+        '''Return an id for the namespaces of nsmap, the same for equal nsmaps in a conversion
+        call'''
+        return context.scopes.setdefault(tuple(nsmap.items()), len(context.scopes))
+
+    def _prefixed(self, tag, nsmap, scope, context):
+        '''Return _uri_to_prefix(tag, nsmap), computed once per tag and namespace scope'''
+        key = (tag, scope)
+        prefixed = context.prefixed.get(key)
+        if prefixed is None:
+            prefixed = context.prefixed[key] = self._uri_to_prefix(tag, nsmap)
+        return prefixed
+
+    def _defer(self, element, deferred=_Deferred):
+        '''Return the data of element with its value deferred, by default until it is JSON
+        encoded. deferred(element, key) creates the placeholder for the value.'''
+        key = self._key(element)
+        return self.dict([(key, deferred(element, key))])
+
+    def _encode_deferred(self, obj, context):
+        '''json default function that converts deferred elements in context'''
+        if not isinstance(obj, _Deferred):
+            # e.g. RecordList
+            return json_default(obj)
+        data = self._walk(obj.element, self._schema_node(obj.element), context=context)
+        return data if obj.key is None else data[obj.key]
+
+    def dump(self, root, fp, **kwargs):
+        '''Write data(root) as JSON to the file-like object fp. The JSON text is written straight
+        from the element tree (see _write_node), the dicts and lists of data(root) are never built
+        and output starts before the whole document is converted. The JSON is identical to
+        json.dump(data(root), fp, **kwargs). Keyword arguments are those of json.dump (e.g.
+        indent=2), arguments other than indent, separators and ensure_ascii are passed to json.dump
+        with the children of root converted one at a time.'''
+        if self.harmonize_synonyms or not _writer_options.issuperset(kwargs):
+            # harmonized data depends on the order elements are converted in, the writer
+            # converts repeated children together
+            return self._dump_deferred(root, fp, **kwargs)
+        writer = JSONWriter(fp, default=json_default, **kwargs)
+        self._write_document(root, self._schema_node(root), _Context(), writer)
+        writer.flush()
+
+    def dumps(self, root, **kwargs):
+        '''Return data(root) as JSON text, identical to json.dumps(data(root), **kwargs).
+        See dump() for the keyword arguments.'''
+        out = StringIO()
+        self.dump(root, out, **kwargs)
+        return out.getvalue()
+
+    def _dump_deferred(self, root, fp, **kwargs):
+        '''dump() with json.dump: the children of root are converted while the JSON is written,
+        so only one of them is held in memory at a time'''
+        context = _Context()
+        data = self._walk(root, self._schema_node(root), _Deferral(self, root), context)
+        json.dump(data, fp, default=lambda obj: self._encode_deferred(obj, context), **kwargs)
+
+    def _write_document(self, root, schema, context, writer):
+        '''Write the JSON of data(root): the value of root wrapped in its key'''
+        writer.parts.append('{' + writer.newline(1) + writer.key(self._wrap_key(root, context)))
+        self._write_walk(root, schema, context, writer, 1)
+        writer.parts.append(writer.newline(0) + '}')
+
+    def _write_walk(self, root, schema, context, writer, level):
+        '''Write the JSON of the value of root (with compiled SchemaNode schema) at indentation
+        level. Frames are generators (see _write_node) kept on an explicit stack like in _walk.
+        They write the JSON of their element around the values of its children: a frame yields
+        (child, level) where the value of child is written.'''
+        stack = [self._write_node(root, schema, context, writer, level)]
+        schemas = [schema]
+        parts = writer.parts
+        while stack:
+            try:
+                child, level = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                schemas.pop()
+                continue
+            schema = schemas[-1] and schemas[-1].children.get(child.tag)
+            stack.append(self._write_node(child, schema, context, writer, level))
+            schemas.append(schema)
+            if len(parts) > BUFFER_PARTS:
+                writer.flush()
+
+    def _write_data(self, root, schema, context, writer, level):
+        '''Write the value of root converted by _walk, for elements whose keys collide: their
+        data merges the colliding values, which a writer frame cannot undo once written'''
+        # XMLData._walk, not the instance attribute: stats would time the conversion twice
+        data = XMLData._walk(self, root, schema, context=context)
+        writer.parts.append(writer.value(self._value(data), level))
 
-        try:
-            # Test for infinity and NaN values
-            if float('-inf') < float(value) < float('inf'):
-                return float(value)
-        except ValueError:
-            pass
+    @staticmethod
+    def _value(data):
+        '''Return the value of the data of one element (see _node), which wraps it in a key'''
+        return next(iter(data.values()))
 
-        return value
+    def _wrap_key(self, element, context):
+        '''Return the key that _node wraps the value of element in'''
+        if not self.ns_as_prefix:
+            return self._qname(element.tag, context)[0]
+        nsmap = element.nsmap
+        return self._prefixed(element.tag, nsmap, self._scope(nsmap, context), context)
 
-    def data(self, root):
-        '''Convert etree.Element into a dictionary.
-        Used for Badgerfish and GData, other conventions overwrite this function.'''
+    @staticmethod
+    def _write_members(members, writer, level):
+        '''Write an object of (key, value) pairs at indentation level'''
+        if not members:
+            writer.parts.append('{}')
+            return
+        newline = writer.newline(level + 1)
+        separator = writer.item_separator + newline
+        writer.parts.append('{' + newline + separator.join(
+            writer.key(key) + writer.value(value, level + 1) for key, value in members) +
+            writer.newline(level) + '}')
+
+    def _write_children(self, children, context, writer, level):
+        '''Writer frame part for an object of the data of children (Abdera, Cobra): their values
+        wrapped in their keys, at indentation level'''
+        parts = writer.parts
+        newline = writer.newline(level + 1)
+        prefix = '{' + newline
+        for child in children:
+            parts.append(prefix + writer.key(self._wrap_key(child, context)))
+            yield child, level + 1
+            prefix = writer.item_separator + newline
+        parts.append(writer.newline(level) + '}')
+
+    @staticmethod
+    def _path(element):
+        '''Return the list of tags from the document root to element'''
+        path = [ancestor.tag for ancestor in element.iterancestors()]
+        path.reverse()
+        path.append(element.tag)
+        return path
+
+    @staticmethod
+    def _record_tags(record_tag):
+        '''Return lxml tag selectors for a tag, localname or sequence of them'''
+        if isinstance(record_tag, basestring):
+            record_tag = [record_tag]
+        # localnames match the tag in any namespace (e.g. MINiML default namespace)
+        return [tag if tag.startswith('{') else '{*}' + tag for tag in record_tag]
+
+    def _node(self, root, schema, context):
+        '''Conversion frame for one etree.Element, returns its dictionary.
+        schema is the compiled SchemaNode of root, None if root is converted without schema typing.
+        context is the _Context of the conversion call.
+        Used for Badgerfish and GData, other conventions overwrite this function.
+        Every child, also one with a repeated tag, comes back wrapped in its {key: value} dict:
+        data converted in advance (convert_parallel, LazyData, the deferred dump) is wrapped too,
+        so array members are unwrapped here at the cost of one small dict per member.'''
 
         value = self.dict()  # create dict that represents the JSON Object
-        children = [node for node in root if isinstance(node.tag, basestring)]  # list of all child elements
-        tag = ET.QName(root).localname
-        nsmap = root.nsmap
+        # all converted child elements, their tags and the number of children per tag
+        children, tags, counts = self._grouped_children(root, context)
+        tag, uri = self._qname(root.tag, context)
+        # lxml builds root.nsmap on every access, it is only read for prefixed names and the
+        # namespace objects of _process_namespace
+        if self.ns_as_prefix:
+            nsmap = root.nsmap
+            # prefixed names are cached per namespace scope
+            scope = self._scope(nsmap, context)
+        else:
+            nsmap = scope = None
         # helper dictionaries for harmonizing of tags and content
         harmonizing_dict = self.dict()
         original_dict = self.dict()
 
-        # if typemapping is based on xml schema initialize stack and manage it
-        if self.schema_typing:
-            self._manage_schema_stack(root)
-
         # if object has a namespace process them (as attribute or not, depending on ns_as_attribute)
-        if ET.QName(root).namespace:
-            value = self._process_namespace(root, value)
+        # only the document root, or every element with ns_as_attrib, gets a namespace object
+        if uri and (context.is_doc_root or self.ns_as_attrib):
+            value = self._process_namespace(root.nsmap if nsmap is None else nsmap, uri, value,
+                                            context)
 
-        self.is_doc_root = False
+        context.is_doc_root = False
         for attr, attrval in root.attrib.items():  # for all attribute kv-pairs of an element
             # if schema_typing is used and the attribute exists in the schema
-            if self.schema_typing:
-                schema_att_element = self.schema_attribute_stack[-1]
-                schema_types = schema_att_element.type
-                schema_attributes = schema_types.attributes
-
+            if schema is not None:
                 # if we find the attribute
-                if schema_attributes.get(attr):
+                if attr in schema.attributes:
                     # attribute types are always simple types
-                    schema_attribute_type = schema_attributes.get(attr).type.base_type   # get attribute base type
-                    attrval = self._typemapping(attrval, schema_attribute_type)  # map attribute to predefined type
+                    attrval = schema.attributes[attr](attrval)  # map attribute to predefined type
                     attr = attr if self.attr_prefix is None else self.attr_prefix + attr  # add attribute prefix if exists
 
                     # harmonize synonyms => certain attribute values are converted to a harmonized value
@@ -224,11 +1049,8 @@ class XMLData(object):
                         value[self.raw_data_name] = harmonizing_dict  # insert object into raw_data dict
                     else:
                         value[attr] = attrval  # create dict entry for attribute
-                    # remove the last item from attribute stack (only if we have attributes and stack is not empty)
-                    # if self.schema_attribute_stack and root.attrib.items():
-                    #     self.schema_attribute_stack.pop()
 
-            if not self.schema_typing:
+            if schema is None:
                 attr = attr if self.attr_prefix is None else self.attr_prefix + attr  # add attribute prefix if exists
                 # harmonize synonyms => characteristic attribute values are converted to a harmonized value
                 if self.harmonize_synonyms and tag == "Characteristics":  # harmonize Characteristics attributes
@@ -242,34 +1064,28 @@ class XMLData(object):
                 else:
                     value[attr] = self._fromstring(attrval)  # create dict entry for attribute
 
-        #uncomment if problems with attr stack
-        if self.schema_attribute_stack and root.attrib.items():
-            self.schema_attribute_stack.pop()
-
         # -------------------------------------- TEXT HANDLING ---------------------------------------------------------
         if root.text and self.text_content is not None:
             text = root.text
             # if we want to infer type from the schema and we can find a type
-            if self.schema_typing and self.schema_element.type:
-                schema_types = self.schema_element.type
-                if schema_types.simple_type:  # if a simple type exists
+            if schema is not None:
+                if schema.text is not None:  # if a simple type exists
                     if text.strip():
-                        schema_simple_type = schema_types.simple_type  # get simple type
-                        if schema_types.simple_type.base_type:  # if a base type exists
-                            schema_base_type = schema_types.simple_type.base_type  # get base type
-                            text = self._typemapping(text, schema_base_type)  # map base type to json type
-                        else:
-                            text = self._typemapping(text, schema_simple_type)  # map simple typ to json type
+                        text = schema.text(text)  # map simple type to json type
 
                         # data cleaning logic for content of specified MINiML-Elements
                         if self.harmonize_synonyms and tag == "Characteristics":  # Logic for Characteristics Content
                             if attrval_harmonized == "treatment_raw":  # treatment_raw gets split => special case
-                                harmonized_text = self._harmonize_content(attrval_harmonized, text.rstrip())  # clean the content
+                                # clean the content
+                                harmonized_text = self._harmonize_content(
+                                    attrval_harmonized, text.rstrip(), context)
                                 harmonizing_dict["concentration"] = {self.text_content: harmonized_text[0]}  # add concentration object with according value to harmonized object
                                 harmonizing_dict["compound"] = {self.text_content: harmonized_text[1]}  # add compound object with according value to harmonized object
                                 original_dict[self.text_content] = self._fromstring(text.rstrip()) # insert original value into original object
                             else: # harmonization for rest of the tag values
-                                harmonized_text = self._harmonize_content(attrval_harmonized, text.rstrip()) # clean the content
+                                # clean the content
+                                harmonized_text = self._harmonize_content(
+                                    attrval_harmonized, text.rstrip(), context)
 
                                 harmonizing_dict[self.text_content] = self._fromstring(harmonized_text.rstrip())  # add harmonized data with according value to harmonized object
                                 original_dict[self.text_content] = self._fromstring(text.rstrip()) # insert original value into original object
@@ -277,7 +1093,9 @@ class XMLData(object):
                             original_dict[self.text_content] = self._fromstring(text.rstrip())  # insert original value into original dict
                             value[self.original_data_name] = original_dict # save original data to dedicated object
 
-                            harmonized_text = self._harmonize_content("Treatment-Protocol", text.rstrip())   # harmonized treatment protocol data
+                            # harmonized treatment protocol data
+                            harmonized_text = self._harmonize_content(
+                                "Treatment-Protocol", text.rstrip(), context)
                             harmonizing_dict["duration"] = {self.text_content: self._fromstring(harmonized_text[0])}  # write duration object into harmonized dict
                             harmonizing_dict["exposure_start"] = {self.text_content: self._fromstring(harmonized_text[1])}  # write exposure start object into harmonized ddict
 
@@ -285,7 +1103,7 @@ class XMLData(object):
 
 
                         elif self.simple_text and len(children) == len(root.attrib) == 0:  # write vlaue if we can and dont use text markup
-                            value = text.rstrip()
+                            value = text
                         else:
                             value[self.text_content] = text   #create object with text markup and value
 
@@ -295,14 +1113,16 @@ class XMLData(object):
 
                         # treatment raw is special case since data is split and turned into 2 content objects
                         if attrval_harmonized == "treatment_raw":
-                            harmonized_text = self._harmonize_content(attrval_harmonized, text.rstrip())
+                            harmonized_text = self._harmonize_content(
+                                attrval_harmonized, text.rstrip(), context)
                             harmonizing_dict["concentration"] = {self.text_content:harmonized_text[0]}
                             harmonizing_dict["compound"] = {self.text_content:harmonized_text[1]}
 
                             original_dict[self.text_content] = self._fromstring(text.rstrip())
                         else:
                         # harmonize tags and content for characteristics
-                            harmonized_text=self._harmonize_content(attrval_harmonized, text.rstrip())
+                            harmonized_text = self._harmonize_content(
+                                attrval_harmonized, text.rstrip(), context)
                             harmonizing_dict[self.text_content] = self._fromstring(harmonized_text.rstrip())
                             original_dict[self.text_content] = self._fromstring(text.rstrip())
 
@@ -312,7 +1132,8 @@ class XMLData(object):
                         original_dict[self.text_content] = self._fromstring(text.rstrip())
                         value[self.original_data_name] = original_dict
                         # write duration and exposure start to protocol data
-                        harmonized_text = self._harmonize_content("Treatment-Protocol", text.rstrip())
+                        harmonized_text = self._harmonize_content(
+                            "Treatment-Protocol", text.rstrip(), context)
                         harmonizing_dict["exposure_duration"] = {self.text_content:self._fromstring(harmonized_text[0])}
                         harmonizing_dict["exposure_start"] = {self.text_content:self._fromstring(harmonized_text[1])}
 
@@ -326,34 +1147,33 @@ class XMLData(object):
                         value[self.text_content] = self._fromstring(text.rstrip())
 
         # note: all tags have fully qualified names including namespace prefix at this point
-        count = Counter(child.tag for child in children)  # count children tags and save number to dict for each child (e.g. Sample:88)
-        for child in children:
-            if self.schema_typing:
-                self._find_schema_element(child)  # find schema element for the child and reassign self.root_schema_element
+        # keys of the arrays of repeated tags, computed once per tag
+        array_keys = {}
+        for child, child_tag in zip(children, tags):
             if self.ns_as_attrib: # if namespaces are to be stored in dedicated object
-                child = XMLData._process_ns(self, child)
-            if count[child.tag] == 1:  # check if simple object is sufficient or array is needed (>1 => Array)
-                value.update(self.data(child))  # add result of recursive function call for new element to dictionary
+                child = self._process_ns(self, child)
+                child_tag = child.tag
+            # check if simple object is sufficient or array is needed (>1 => Array)
+            if counts.get(child_tag) == 1:
+                value.update((yield child))  # add converted child element to dictionary
             else:
-                if not self.ns_as_prefix:
-                    child_tag = ET.QName(child).localname  # remove namespace prefix
-                elif self.ns_as_prefix:
-                    # use first one if prefixes for namespaces, uncomment second one if full uri as prefix
-                    child_tag = self._uri_to_prefix(child.tag, nsmap)
-                    # child_tag = child.tag
-
-                # setdefault: returns value of child.tag if it exists, if not create key and set value to self.list()
-                result = value.setdefault(child_tag, self.list()) # get array if already exists or create empty array for the data
-                result += self.data(child).values()  # add values of result of recursive function call to result object
-
-        # TODO this is in testing
-        # if self.schema_typing:
-        #     if children:
-        #         # remove element from schema stack after all children are done (but only if its not a leaf)
-        #         self.schema_stack.pop()
-        #         # set next higher element to root element (do not if stack is empty i.e in last step if root got removed)
-        #         if self.schema_stack:
-        #             self.root_schema_element = self.schema_stack[-1]
+                key = array_keys.get(child_tag)
+                if key is None:
+                    if not self.ns_as_prefix:
+                        key = self._qname(child_tag, context)[0]  # remove namespace prefix
+                    else:
+                        # use first one if prefixes for namespaces, uncomment second one if full
+                        # uri as prefix
+                        key = self._prefixed(child_tag, nsmap, scope, context)
+                        # key = child_tag
+                    array_keys[child_tag] = key
+
+                # get array if already exists or create empty array for the data
+                if key not in value:
+                    value[key] = self.list()
+                result = value[key]
+                # add values of converted child element to result object
+                result += (yield child).values()
 
         # if simple_text, elements with no children nor attrs become '', not {}
         if isinstance(value, dict) and not value and self.simple_text:
@@ -366,19 +1186,113 @@ class XMLData(object):
         # if we want prefixed objectnames
         if self.ns_as_prefix:
             # use this function if prefix abbr. and not uris are wanted
-            tag = self._uri_to_prefix(root.tag, nsmap)
+            tag = self._prefixed(root.tag, nsmap, scope, context)
             return self.dict([(tag, value)])
             # use this if uris as prefix are wanted
             # return self.dict([(root.tag, value)])
 
+    def _write_node(self, root, schema, context, writer, level):
+        '''Writer frame for one etree.Element (see _write_walk): writes the JSON of the value that
+        _node returns for root. Used for Badgerfish and GData, other conventions overwrite this
+        function.'''
+        children, child_tags, _ = self._grouped_children(root, context)
+        if self.ns_as_attrib and any(_declares_namespaces(child) for child in children):
+            # _process_ns changes these children while they are converted
+            return self._write_data(root, schema, context, writer, level)
+        # key -> children, repeated children are a list under the key of their tag
+        groups = {}
+        if children:
+            nsmap = root.nsmap if self.ns_as_prefix else None
+            scope = self._scope(nsmap, context) if self.ns_as_prefix else None
+            tags = {}
+            for child, child_tag in zip(children, child_tags):
+                group = tags.get(child_tag)
+                if group is None:
+                    tags[child_tag] = [child]
+                else:
+                    group.append(child)
+            for child_tag, group in tags.items():
+                if len(group) == 1:
+                    key = self._wrap_key(group[0], context)
+                elif not self.ns_as_prefix:
+                    key = self._qname(child_tag, context)[0]
+                else:
+                    key = self._prefixed(child_tag, nsmap, scope, context)
+                groups.setdefault(key, group)
+            if len(groups) != len(tags):
+                return self._write_data(root, schema, context, writer, level)
+
+        tag, uri = self._qname(root.tag, context)
+        # (key, value) pairs before the children: namespaces, attributes and text
+        members = []
+        is_doc_root = context.is_doc_root
+        if uri and (is_doc_root or self.ns_as_attrib):
+            members.extend(self._process_namespace(root.nsmap, uri, self.dict(), context).items())
+        context.is_doc_root = False
+        for attr, attrval in root.attrib.items():
+            if schema is not None:
+                # attributes that are not declared in the schema are dropped
+                convert = schema.attributes.get(attr)
+                if convert is None:
+                    continue
+                attrval = convert(attrval)
+            else:
+                attrval = self._fromstring(attrval)
+            if self.attr_prefix is not None:
+                attr = self.attr_prefix + attr
+            members.append((attr, attrval))
+
+        text = root.text
+        if text and self.text_content is not None:
+            if schema is not None:
+                text = schema.text(text) if schema.text is not None and text.strip() else _NO_TEXT
+            else:
+                text = self._fromstring(text.rstrip()) if text.strip() else _NO_TEXT
+            if text is not _NO_TEXT:
+                if self.simple_text and not children and not root.attrib:
+                    writer.parts.append(writer.value(text, level))
+                    return
+                members.append((self.text_content, text))
+
+        keys = set(key for key, _ in members)
+        if len(keys) != len(members) or not keys.isdisjoint(groups):
+            context.is_doc_root = is_doc_root
+            return self._write_data(root, schema, context, writer, level)
+
+        parts = writer.parts
+        if not members and not groups:
+            # if simple_text, elements with no children nor attrs become '', not {}
+            parts.append('""' if self.simple_text else '{}')
+            return
+        newline = writer.newline(level + 1)
+        separator = writer.item_separator + newline
+        prefix = '{' + newline
+        for key, value in members:
+            parts.append(prefix + writer.key(key) + writer.value(value, level + 1))
+            prefix = separator
+        for key, group in groups.items():
+            if len(group) == 1:
+                parts.append(prefix + writer.key(key))
+                yield group[0], level + 1
+            else:
+                item_newline = writer.newline(level + 2)
+                parts.append(prefix + writer.key(key) + '[' + item_newline)
+                for index, child in enumerate(group):
+                    if index:
+                        parts.append(writer.item_separator + item_newline)
+                    yield child, level + 2
+                parts.append(newline + ']')
+            prefix = separator
+        parts.append(writer.newline(level) + '}')
+
     def etree(self, data, root=None):
         '''Convert data structure into a list of etree.Element'''
         '''Fails if namespace handling is customized and deviates from convention standard'''
         result = self.list() if root is None else root
-        if isinstance(data, (self.dict, dict)):
+        if isinstance(data, (self.dict, Mapping)):
             for key, value in data.items():
                 value_is_list = isinstance(value, (self.list, list))
-                value_is_dict = isinstance(value, (self.dict, dict))
+                value_is_dict = isinstance(value, (self.dict, Mapping))
                 # Add attributes and text to result (if root)
                 if root is not None:
                     # Handle attribute prefixes (BadgerFish)
@@ -448,7 +1362,7 @@ class XMLData(object):
                         result.append(elem)
 
                     # Treat scalars as text content, not children (Parker)
-                    if not isinstance(value, (self.dict, dict, self.list, list)):
+                    if not isinstance(value, (self.dict, Mapping, self.list, list)):
                         if self.text_content:
                             value = {self.text_content: value}
                     self.etree(value, root=elem)
@@ -465,6 +1379,209 @@ class XMLData(object):
                     result.append(elem)
         return result
 
+    def write_xml(self, data, fileobj, root=None, encoding='utf-8'):
+        '''Write data as an XML document to fileobj (a filename or binary file-like object) with
+        lxml.etree.xmlfile. data is converted like etree(data), but the children of the root
+        element are converted and written one at a time, so memory is bounded by the largest child.
+        data is a dictionary with one key, the root element, e.g. {'root': {'item': [...]}}.
+        If root (a tag) is given, data is the value of the root element instead (e.g. Parker data)
+        or an iterable of dictionaries (e.g. records from iterdata()) that are its children.'''
+        if root is None:
+            if not isinstance(data, (self.dict, Mapping)) or len(data) != 1:
+                raise ValueError('data needs exactly one root element, '
+                                 'use root= to wrap it in one')
+            (tag, value), = data.items()
+            element, children = self._xml_parts(tag, value)
+        elif isinstance(data, (self.dict, Mapping)):
+            element, children = self._xml_parts(root, data)
+        else:
+            element, children = self.element(root), data
+
+        with ET.xmlfile(fileobj, encoding=encoding) as xf:
+            xf.write_declaration()
+            with xf.element(element.tag, dict(element.attrib), nsmap=element.nsmap):
+                if element.text:
+                    xf.write(element.text)
+                for child in element:
+                    xf.write(child)
+                for child_data in children:
+                    for child in self.etree(child_data):
+                        xf.write(child)
+
+    def _xml_parts(self, tag, value):
+        '''Split the data of element tag for write_xml(): return the element with its attributes
+        and text, and an iterator over the data of its children, e.g. {'child': {...}}'''
+        if not isinstance(value, (self.dict, Mapping)):
+            return self.etree({tag: value})[0], ()
+        own, children = self.dict(), []
+        for key, val in value.items():
+            is_list = isinstance(val, (self.list, list))
+            # keys are children if they create child elements. etree() treats all items of a list
+            # alike, so a list with the first item is enough
+            probe = self.element(tag)
+            self.etree({key: val[:1] if is_list else val}, root=probe)
+            if len(probe):
+                children.append((key, val if is_list else [val]))
+            else:
+                own[key] = val
+        element = self.etree({tag: own})[0]
+        return element, (self.dict([(key, item)]) for key, items in children for item in items)
+
+    def iterdata(self, source, record_tag, include=None, exclude=None, **kwargs):
+        '''Convert every record_tag element of source into a dictionary, one at a time.
+        source is a filename or file-like object. record_tag is a tag, a localname (matched in
+        any namespace) or a sequence of them, e.g. ('Sample', 'Platform', 'Series').
+        Each record is converted like a document root, records inside other records are
+        converted with the outer record only. Records and everything parsed before them
+        are cleared once converted, so memory stays bounded by one record, not the whole file.
+        include and exclude select elements like in data(), by their path from the document root.
+        Skipped elements are removed as soon as they are parsed, records that are skipped are not
+        returned.
+        Other keyword arguments are passed to lxml.etree.iterparse
+        (e.g. remove_blank_text=True).'''
+        for record in self._records(source, record_tag, include, exclude, kwargs):
+            # every record is converted like a document of its own
+            yield self.data(record)
+
+    def _records(self, source, record_tag, include, exclude, kwargs):
+        '''Iterate over the record elements of source for iterdata(), every record is cleared
+        after it is used'''
+        tags = self._record_tags(record_tag)
+        if include is not None or exclude is not None:
+            for record in self._iterselect(source, tags, PathFilter(include, exclude), kwargs):
+                yield record
+                _free_record(record)
+            return
+        events = iterparse(source, events=('end',), tag=tags, **kwargs)
+        if self.stats is not None:
+            events = self.stats.timed_iter('parse', events)
+        for event, elem in events:
+            # records nested in other records are converted with them
+            if _nested_record(elem, tags):
+                continue
+            yield elem
+            _free_record(elem)
+
+    @staticmethod
+    def _iterselect(source, tags, paths, kwargs):
+        '''Iterate over the record elements with tags of source that paths select. Elements that
+        are not selected are removed from the tree when they end.'''
+        # [state, True if a child is kept] of the open elements
+        stack = []
+        for event, elem in iterparse(source, events=('start', 'end'), **kwargs):
+            if event == 'start':
+                state = paths.child(stack[-1][0] if stack else paths.start, elem.tag)
+                stack.append([state, False])
+                continue
+            state, has_kept_child = stack.pop()
+            if not paths.kept(state, has_kept_child):
+                parent = elem.getparent()
+                if parent is not None:
+                    parent.remove(elem)
+                continue
+            if stack:
+                stack[-1][1] = True
+            localname = elem.tag.rpartition('}')[2]
+            if (any(tag == elem.tag or tag == '{*}' + localname for tag in tags) and
+                    not _nested_record(elem, tags)):
+                yield elem
+
+    def ndjson(self, source, record_tag, **kwargs):
+        '''Like iterdata(), but yield every record as one line of compact JSON (NDJSON) ending
+        with a newline, e.g. for bulk loaders: out.writelines(gdata.ndjson(source, 'Sample'))'''
+        include, exclude = kwargs.pop('include', None), kwargs.pop('exclude', None)
+        for record in self._records(source, record_tag, include, exclude, kwargs):
+            yield self.dumps(record, separators=(',', ':')) + '\n'
+
+    def feeder(self, record_tag=None, **kwargs):
+        '''Return a Feeder to convert a document chunk by chunk: feed(data) returns the list of
+        record_tag elements (matched like in iterdata()) that data completes, converted into
+        dictionaries. close() returns the remaining ones. Without record_tag, close() returns the
+        whole document as the only record. Other keyword arguments are passed to
+        lxml.etree.XMLPullParser (e.g. remove_blank_text=True).'''
+        return Feeder(self, record_tag, **kwargs)
+
+    async def adata(self, source, executor=None, chunk_size=65536, **kwargs):
+        '''Asynchronous data() for asyncio. source is bytes, a file-like object with a read(size)
+        function or coroutine (e.g. aiohttp StreamReader) or an (async) iterable of byte chunks.
+        It is parsed chunk by chunk, then the children of the root element are converted one at a
+        time, in executor (see loop.run_in_executor) if given. executor must be a thread pool
+        (e.g. ThreadPoolExecutor): lxml elements cannot be pickled, so a ProcessPoolExecutor
+        raises ValueError. Control returns to the event loop after every chunk and child. Other
+        keyword arguments are passed to lxml.etree.XMLPullParser.'''
+        import asyncio
+        _check_executor(executor)
+        parser = ET.XMLPullParser(**kwargs)
+        async for chunk in _achunks(source, chunk_size):
+            parser.feed(chunk)
+            await asyncio.sleep(0)
+        root = parser.close()
+        return await self._awalk(root, self._schema_node(root), executor)
+
+    async def _awalk(self, root, schema, executor):
+        '''_walk root, converting every child of root in a step of its own'''
+        import asyncio
+        loop = asyncio.get_running_loop()
+        context = _Context()
+        frame, data = self._node(root, schema, context), None
+        while True:
+            try:
+                child = frame.send(data)
+            except StopIteration as done:
+                return done.value
+            child_schema = schema and schema.children.get(child.tag)
+            if executor is None:
+                data = self._walk(child, child_schema, context=context)
+            else:
+                # the context is used by one child conversion at a time
+                data = await loop.run_in_executor(
+                    executor, partial(self._walk, child, child_schema, context=context))
+            await asyncio.sleep(0)
+
+    async def aiterdata(self, source, record_tag, executor=None, chunk_size=65536, **kwargs):
+        '''Asynchronous iterdata(): async iterator over the converted record_tag elements of source
+        (see adata()). Records are yielded as soon as they are parsed, converted in executor if
+        given. Like in adata(), executor must be a thread pool. Other keyword arguments are passed
+        to lxml.etree.XMLPullParser.'''
+        import asyncio
+        _check_executor(executor)
+        records = _Records(record_tag, **kwargs)
+        loop = asyncio.get_running_loop()
+        async for chunk in _achunks(source, chunk_size):
+            for elem in records.feed(chunk):
+                if executor is None:
+                    yield self.data(elem)
+                else:
+                    yield await loop.run_in_executor(executor, self.data, elem)
+            await asyncio.sleep(0)
+        for elem in records.close():
+            if executor is None:
+                yield self.data(elem)
+            else:
+                yield await loop.run_in_executor(executor, self.data, elem)
+
+    def convert_parallel(self, source, record_tag, workers=None, **kwargs):
+        '''Convert source (a filename or file-like object) into a dictionary, converting the
+        record_tag elements in a pool of worker processes. record_tag is matched like in
+        iterdata(). workers is the number of processes, default is the number of CPUs.
+        The result is identical to data(parse(source).getroot()), records keep their order.
+        Other keyword arguments are passed to lxml.etree.XMLParser
+        (e.g. remove_blank_text=True).'''
+        from concurrent.futures import ProcessPoolExecutor
+        root = ET.parse(source, ET.XMLParser(**kwargs)).getroot()
+        tags = self._record_tags(record_tag)
+        # records nested in other records are converted with them
+        records = [elem for elem in root.iter(*tags) if not _nested_record(elem, tags)]
+        tasks = [(ET.tostring(elem, with_tail=False),
+                  self._path(elem) if self.schema_typing else None) for elem in records]
+
+        workers = workers or os.cpu_count() or 1
+        pool = ProcessPoolExecutor(workers, initializer=_parallel_init, initargs=(self, kwargs))
+        with pool:
+            chunksize = max(1, len(tasks) // (4 * workers))
+            converted = dict(zip(records, pool.map(_parallel_convert, tasks, chunksize=chunksize)))
+        return self._walk(root, self._schema_node(root), converted)
+
     @staticmethod
     def _process_ns(cls, element):
         """strip namespaces"""
@@ -522,48 +1639,13 @@ class XMLData(object):
                         elem.set('xmlns:{}'.format(ns_prefix), ns_uri)
         return ElementTree(root).getroot()
 
-    def _find_schema_element(self, xmlelement):
-        """Helper function for converters. Search schema for fitting element for xmlelement.
-        self.schema_stack contains all visited elements that have not yet been found
-        self.root_schema_element is the root of the current subtree. """
-        # todo define what to do if element cant be found // at least raise exception
-        self.schema_element_found = False
-        while not self.schema_element_found:
-            for i in self.root_schema_element: #search child elements of current root_schema_element for matches
-                if i.name == xmlelement.tag:
-                    self.schema_stack.append(i)
-                    self.root_schema_element = i
-                    if xmlelement.attrib.items():
-                        self.schema_attribute_stack.append(i)
-                    self.schema_element_found = True  # break loop if match is found
-                    break
-            if not self.schema_element_found:
-                # repeat for loop with next higher element if there is no match
-                self.schema_stack.pop()
-                self.root_schema_element = self.schema_stack[-1]
-
-    def _manage_schema_stack(self, root):
-        """initialize schema stack and remove elements if needed"""
-        if self.is_doc_root:
-            self.schema_element = self.xml_schema.elements[ET.QName(root).localname]
-            self.root_schema_element = self.schema_element
-            self.schema_stack.append(self.root_schema_element)
-            # if attributes exist for element find the attributes in the schema
-            if root.attrib.items():
-                self.schema_attribute_stack.append(self.root_schema_element)
-        # if root is just text, remove from stack to avoid errors
-        elif root.text:
-            self.schema_element = self.schema_stack.pop()
-            self.root_schema_element = self.schema_stack[-1]
-
-    def _process_namespace(self, root, value):
+    def _process_namespace(self, nsmap, uri, value, context):
         """create namespace object in root and namespaces attribute objects, if ns_as_attrib = True
+        nsmap are the namespaces of the element, uri its namespace.
         Only used in badgerfish and gdata. Other conventions skip namespaces."""
-        nsmap = root.nsmap
-        uri = ET.QName(root).namespace
         # split namespace uri and tag
         # pushing namespaces to dict; Filtering namespaces by prefix except root node
-        if self.is_doc_root:
+        if context.is_doc_root:
             # initialize namespace object
             value[self.ns_name] = {}
             for key in nsmap.keys():
@@ -635,24 +1717,20 @@ class XMLData(object):
 
     def _harmonize_tag(self, tag):
         """harmonize tag names (characteristic tags are attributesin XML)"""
-        #position 0 contains list of synonyms, position 1 contains harmonized tag
-        if tag in config.harmonize_as_age_raw[0]:
-            return config.harmonize_as_age_raw[1]
-        elif tag in config.harmonize_as_genotype_raw[0]:
-            return config.harmonize_as_genotype_raw[1]
-        elif tag in config.harmonize_as_treatment_raw[0]:
-            return config.harmonize_as_treatment_raw[1]
-        else:
-            return tag
+        # synonyms are compiled into one dict at construction, see _compile_synonyms
+        key = _normalize_synonym(tag) if self.normalize_synonyms else tag
+        return self._synonyms.get(key, tag)
 
-    def _harmonize_content(self, tag, content):
-        """extract raw_data content by predefined rules"""
+    def _harmonize_content(self, tag, content, context):
+        """extract raw_data content by predefined rules, age is kept in context for treatment
+        protocols"""
 
         if tag == "age_raw":
             age_raw = self.parse_for_hpf(content)
-            self.age = age_raw[0]  # save current age to compute exposure start for treatment protocol
-            self.age_unit = age_raw[1] # save current unit to compute exposure start for treatment protocol
-            raw_age = self.age + " " + self.age_unit
+            # save current age and unit to compute exposure start for treatment protocol
+            context.age = age_raw[0]
+            context.age_unit = age_raw[1]
+            raw_age = context.age + " " + context.age_unit
 
             return raw_age
         elif tag == "treatment_raw":
@@ -660,14 +1738,15 @@ class XMLData(object):
             return concentration_and_compound_raw
         elif tag == "Treatment-Protocol":
             duration_raw = self.parse_for_exposure_duration(content) # result is tuple (time, unit)
-            self.duration = duration_raw[0]
-            self.duration_unit = duration_raw[1]
+            context.duration = duration_raw[0]
+            context.duration_unit = duration_raw[1]
 
-            duration_in_hours = self.convert_to_hours(self.duration, self.duration_unit)
+            duration_in_hours = self.convert_to_hours(context.duration, context.duration_unit)
 
 
             duration_raw = str(duration_in_hours) + " " + "hours" # return result as one string in this case
-            raw_exposure_start = self.calculate_exposure_start(self.age, self.age_unit, self.duration, self.duration_unit)
+            raw_exposure_start = self.calculate_exposure_start(
+                context.age, context.age_unit, context.duration, context.duration_unit)
 
             return (duration_raw, raw_exposure_start)
         # elif tag == "treatment_raw":
@@ -681,77 +1760,23 @@ class XMLData(object):
 
     def parse_for_hpf(self, content):
         """parses content for a number and a unit"""
-
-        numbers_and_units = re.findall(r'(\d+\.*\d*\s?)([a-zA-Z]*)', content)
-        # # insert spaces if not there
-        # for i in numbers_and_units:
-        #     result = re.sub(r'(\d)([a-zA-Z])', r'\1 \2', i)
-
-        #return first tuple ("time", "unit"), list always contains 1 element
-        return numbers_and_units[0]
+        return harmonize.parse_for_hpf(content)
 
     def parse_for_concentration_and_compound(self, content):
         """parses treatment data for concentration and compound. Returns Tuple (concentration+unit, compound)."""
-        # remove time entries from text, since sometimes times pollute the data
-        text_without_time = re.sub(r'(\d+\.*\d*\s?(millisecond|second|hour|minute|milliseconds'
-                                   r'|seconds|hours|minutes|sec|min|ms\b|s\b|m\b|h\b))',r'', content)
-
-        numbers_and_units = re.findall(r'(\d+\.*\d*\s?)([a-zA-Z]*[/]?[a-zA-Z]*)', text_without_time)
-
-        # remove numbers_and_units from text, rest is compound
-        compound = re.sub(r'\d+\.*\d*\s?[a-zA-Z]*[/]?[a-zA-Z]*', r'', text_without_time)
-        compound = compound.strip()
-        # assumption: only one unit couple
-        if numbers_and_units:
-            concentration_number = numbers_and_units[0][0].split()[0] #indexing after split because split makes list again
-            concentration_unit = numbers_and_units[0][1].split()[0]
-            numbers_and_units = concentration_number + " " + concentration_unit
-
-        result = (numbers_and_units, compound)
-        return result
+        return harmonize.parse_for_concentration_and_compound(content)
 
     def parse_for_exposure_duration(self, content):
         """Parses Treatment-Data for duration"""
-        # extract time dates. eg. 30 min, 0.5h, 30s, ...
-        time_and_unit = re.findall(r'(\d+\.*\d*\s?)(millisecond|second|hour|minute'
-                                   r'|milliseconds|seconds|hours|minutes|sec|min|ms\b|s\b|m\b|h\b)', content)
-
-        #return time unit tuple (duration, unit)
-        return(time_and_unit[0])
+        return harmonize.parse_for_exposure_duration(content)
 
     def calculate_exposure_start(self, age, age_unit, duration, duration_unit):
         """calculate difference between age and duration in hours"""
-
-        # not fully tested
-        age_in_hours = self.convert_to_hours(age, age_unit)
-        duration_in_hours = self.convert_to_hours(duration, duration_unit)
-
-        # im endeffekt embryo age - factor duration (als Annahme)
-        exposure_start_in_hours = age_in_hours - duration_in_hours
-        exposure_start_in_hours = round(exposure_start_in_hours, 4)
-
-        return(str(exposure_start_in_hours) + " " + "hours")
+        return harmonize.calculate_exposure_start(age, age_unit, duration, duration_unit)
 
     def convert_to_hours(self, duration, unit):
         """convert duration to hours"""
-        # abbreviations that are checked to determine the unit
-        second_names = ["s", "s.", "sec", "sec.", "secs", "second", "seconds", "spf", "seconds post fertilization"]
-        minute_names = ["m", "m.", "min", "min.", "mins", "minute", "minutes", "mpf", "minutes post fertilization"]
-        hour_names = ["h", "h.", "hour", "hours", "hpf", "hours post fertilization", "hours post fert."]
-
-        # transform strings to floats
-        duration = float(duration)
-
-        if unit in second_names:
-            duration_in_hours = duration / 3600
-        elif unit in minute_names:
-            duration_in_hours = duration / 60
-        elif unit in hour_names:
-            duration_in_hours = duration
-        else:
-            duration_in_hours = None #testing purposes
-
-        return(duration_in_hours)
+        return harmonize.convert_to_hours(duration, unit)
 
 
 class BadgerFish(XMLData):
@@ -777,77 +1802,120 @@ class Parker(XMLData):
     def __init__(self, ns_as_prefix=False, **kwargs):
         super(Parker, self).__init__(ns_as_attrib=False, conv="parker", ns_as_prefix=ns_as_prefix, **kwargs)
 
-    def data(self, root, preserve_root=False):
-        '''Convert etree.Element into a dictionary'''
-        # If preserve_root is False, return the root element. This is easiest
-        # done by wrapping the XML in a dummy root element that will be ignored.
-        # print(self.schema_stack)
-        # if typemapping is based on xml schema, search schema for element and get type
-        nsmap = root.nsmap
-        tag = root.tag
-        if self.schema_typing:
-            self._manage_schema_stack(root)
+    def data(self, root, preserve_root=False, include=None, exclude=None):
+        '''Convert etree.Element into a dictionary, include and exclude see XMLData.data'''
+        context = self._select(root, include, exclude)
+        data = self._walk(root, self._schema_node(root), context=context)
+        return self._preserve_root(root, data, preserve_root)
+
+    def lazydata(self, root, preserve_root=False):
+        '''Like data(), but children with child elements are converted on access, see
+        XMLData.lazydata'''
+        return self._preserve_root(root, super(Parker, self).lazydata(root), preserve_root)
 
+    def _preserve_root(self, root, data, preserve_root):
+        # If preserve_root is False, the root element is absorbed. Otherwise it is
+        # wrapped like a child of a dummy root element.
         if preserve_root:
-            new_root = root.makeelement('dummy_root', {})
-            new_root.insert(0, root)
-            root = new_root
+            tag = root.tag if self.ns_as_prefix else ET.QName(root).localname
+            return self.dict([(tag, data)])
+        return data
 
-        self.is_doc_root = False
-        children = [node for node in root if isinstance(node.tag, basestring)]
+    def _defer(self, element, deferred=_Deferred):
+        # Parker does not wrap element data in its tag
+        return deferred(element, None)
+
+    @staticmethod
+    def _value(data):
+        # Parker does not wrap element data in its tag
+        return data
+
+    def _write_document(self, root, schema, context, writer):
+        # the root element is absorbed
+        self._write_walk(root, schema, context, writer, 0)
+
+    def _node(self, root, schema, context):
+        '''Conversion frame for one etree.Element'''
+        context.is_doc_root = False
+        children, tags, counts = self._grouped_children(root, context)
         # If no children, just return the text
         if len(children) == 0:
-            if self.schema_typing and self.schema_element.type:
-                schema_types = self.schema_element.type
+            if schema is not None and root.text is not None:
                 # if a simple type exists
-                if schema_types.simple_type:
-                    # get simple type
-                    schema_simple_type = schema_types.simple_type
-                    # if a base type exists
-                    if schema_types.simple_type.base_type:
-                        schema_base_type = schema_types.simple_type.base_type
-                        text = self._typemapping(root.text, schema_base_type)
-                    else:
-                        text = self._typemapping(root.text, schema_simple_type)
-
-                    return text
+                if schema.text is not None:
+                    return schema.text(root.text)
                 else:
-                    return self._fromstring(root.text).rstrip()
+                    return self._fromstring(root.text.rstrip())
 
             else:
                 return self._fromstring(root.text)
 
         # Element names become object properties
-        count = Counter(child.tag for child in children)
         result = self.dict()
 
-        for child in children:
-
-            if self.schema_typing:
-                self._find_schema_element(child)
+        for child, child_tag in zip(children, tags):
 
             if not self.ns_as_prefix:
-                tag = ET.QName(child).localname
-
-            if self.ns_as_prefix:
-
-                tag = child.tag  # use this if uris as prefix
+                tag = self._qname(child_tag, context)[0]
+            else:
+                tag = child_tag  # use this if uris as prefix
             #    tag = self._uri_to_prefix(child.tag, nsmap) #use this if uri-prefix as prefix
 
-            if count[child.tag] == 1:
-                result[tag] = self.data(child)
+            if counts[child_tag] == 1:
+                result[tag] = yield child
             else:
-                result.setdefault(tag, self.list()).append(self.data(child))
-
-        if self.schema_typing:
-            if children:
-                self.schema_stack.pop()
-                # only do this if not root element - adjust if it causes problems
-                if self.schema_stack:
-                    self.root_schema_element = self.schema_stack[-1]
+                if tag not in result:
+                    result[tag] = self.list()
+                result[tag].append((yield child))
 
         return result
 
+    def _write_node(self, root, schema, context, writer, level):
+        '''Writer frame for one etree.Element, see XMLData._write_node'''
+        context.is_doc_root = False
+        children, tags, _ = self._grouped_children(root, context)
+        parts = writer.parts
+        if len(children) == 0:
+            if schema is not None and root.text is not None:
+                if schema.text is not None:
+                    value = schema.text(root.text)
+                else:
+                    value = self._fromstring(root.text.rstrip())
+            else:
+                value = self._fromstring(root.text)
+            parts.append(writer.value(value, level))
+            return
+
+        # key -> [tag, children], repeated children are a list under the key of their tag
+        groups = {}
+        for child, child_tag in zip(children, tags):
+            key = child_tag if self.ns_as_prefix else self._qname(child_tag, context)[0]
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [child_tag, [child]]
+            elif group[0] != child_tag:
+                # tags in different namespaces, their values are merged
+                return self._write_data(root, schema, context, writer, level)
+            else:
+                group[1].append(child)
+
+        newline = writer.newline(level + 1)
+        prefix = '{' + newline
+        for key, (_, group) in groups.items():
+            if len(group) == 1:
+                parts.append(prefix + writer.key(key))
+                yield group[0], level + 1
+            else:
+                item_newline = writer.newline(level + 2)
+                parts.append(prefix + writer.key(key) + '[' + item_newline)
+                for index, child in enumerate(group):
+                    if index:
+                        parts.append(writer.item_separator + item_newline)
+                    yield child, level + 2
+                parts.append(newline + ']')
+            prefix = writer.item_separator + newline
+        parts.append(writer.newline(level) + '}')
+
 
 class Abdera(XMLData):
     '''Converts between XML and data using the Abdera convention'''
@@ -856,72 +1924,58 @@ class Abdera(XMLData):
         super(Abdera, self).__init__(simple_text=True, text_content=True, ns_as_attrib=False, conv="abdera",
                                      ns_as_prefix=ns_as_prefix, **kwargs)
 
-    def data(self, root):
-        '''Convert etree.Element into a dictionary'''
-        value = self.dict()
-        tag = ET.QName(root).localname
-        nsmap = root.nsmap
-        if self.schema_typing:
-            self._manage_schema_stack(root)
+    def _key(self, element):
+        # Abdera prefixes tags with namespace uris
+        return unicode(element.tag if self.ns_as_prefix else ET.QName(element).localname)
 
-        self.is_doc_root = False
+    def _wrap_key(self, element, context):
+        return unicode(element.tag if self.ns_as_prefix else self._qname(element.tag, context)[0])
+
+    def _node(self, root, schema, context):
+        '''Conversion frame for one etree.Element'''
+        value = self.dict()
+        tag = self._qname(root.tag, context)[0]
+        context.is_doc_root = False
 
         # Add attributes specific 'attributes' key
         if root.attrib:
             value['attributes'] = self.dict()
             for attr, attrval in root.attrib.items():
 
-                if self.schema_typing:
-                    schema_att_element = self.schema_attribute_stack[-1]
-                    schema_types = schema_att_element.type
-                    schema_attributes = schema_types.attributes
-
+                if schema is not None:
                     # if we find the attribute
-                    if schema_attributes.get(attr):
+                    if attr in schema.attributes:
                         # attribute types are always simple types
-                        schema_attribute_type = schema_attributes.get(attr).type.base_type
-                        attrval = self._typemapping(attrval, schema_attribute_type)
+                        attrval = schema.attributes[attr](attrval)
                         # harmonize synonyms
                         if self.harmonize_synonyms:
                             attrval = self._harmonize_tag(attrval)
                         value['attributes'][unicode(attr)] = attrval
 
-                if not self.schema_typing:
+                if schema is None:
                     # harmonize synonyms
                     if self.harmonize_synonyms:
                         attrval = self._harmonize_tag(attrval)
                     value['attributes'][unicode(attr)] = self._fromstring(attrval)
 
-        # remove the last item from attribute stack (only if we have attributes and stack is not empty)
-        if self.schema_attribute_stack and root.attrib.items():
-            self.schema_attribute_stack.pop()
-
         # Add children to specific 'children' key
         children_list = self.list()
-        children = [node for node in root if isinstance(node.tag, basestring)]
+        children = self._children(root, context)
 
         # Add root text
         if root.text and self.text_content is not None:
             text = root.text
 
-            if self.schema_typing and self.schema_element.type:
-                schema_types = self.schema_element.type
+            if schema is not None:
                 # if a simple type exists
-                if schema_types.simple_type:
+                if schema.text is not None:
                     if text.strip():
-                        # get simple type
-                        schema_simple_type = schema_types.simple_type
-                        # if a base type exists
-                        if schema_types.simple_type.base_type:
-                            schema_base_type = schema_types.simple_type.base_type
-                            text = self._typemapping(text, schema_base_type)
-                        else:
-                            text = self._typemapping(text, schema_simple_type)
+                        text = schema.text(text)
 
                         if self.simple_text and len(children) == len(root.attrib) == 0:
-                            value = text.rstrip()
+                            value = text
                         else:
-                            children_list = [text.rstrip(), ]
+                            children_list = [text, ]
 
             else:
                 if text.strip():
@@ -931,19 +1985,9 @@ class Abdera(XMLData):
                         children_list = [self._fromstring(text.rstrip()), ]
 
         for child in children:
-            if self.schema_typing:
-                self._find_schema_element(child)
-
-            child_data = self.data(child)
+            child_data = yield child
             children_list.append(child_data)
 
-        if self.schema_typing:
-            if children:
-                self.schema_stack.pop()
-                # only do this if not root element - adjust if it causes problems
-                if self.schema_stack:
-                    self.root_schema_element = self.schema_stack[-1]
-
         # Flatten children
         if len(root.attrib) == 0 and len(children_list) == 1:
             value = children_list[0]
@@ -960,6 +2004,65 @@ class Abdera(XMLData):
             tag = root.tag # use this if uris as prefix are wanted
             return self.dict([(unicode(tag), value)])
 
+    def _write_node(self, root, schema, context, writer, level):
+        '''Writer frame for one etree.Element, see XMLData._write_node'''
+        context.is_doc_root = False
+        attributes = []
+        for attr, attrval in root.attrib.items():
+            if schema is not None:
+                convert = schema.attributes.get(attr)
+                if convert is None:
+                    continue
+                attributes.append((unicode(attr), convert(attrval)))
+            else:
+                attributes.append((unicode(attr), self._fromstring(attrval)))
+        children = self._children(root, context)
+
+        text = root.text
+        if text and self.text_content is not None:
+            if schema is not None:
+                text = schema.text(text) if schema.text is not None and text.strip() else _NO_TEXT
+            else:
+                text = self._fromstring(text.rstrip()) if text.strip() else _NO_TEXT
+            if (text is not _NO_TEXT and self.simple_text and
+                    len(children) == len(root.attrib) == 0):
+                writer.parts.append(writer.value(text, level))
+                return
+        else:
+            text = _NO_TEXT
+
+        parts = writer.parts
+        items = len(children) + (text is not _NO_TEXT)
+        if not root.attrib and items <= 1:
+            # Flatten children
+            if text is not _NO_TEXT:
+                parts.append(writer.value(text, level))
+            elif children:
+                yield from self._write_children(children, context, writer, level)
+            else:
+                parts.append('{}')
+            return
+
+        newline = writer.newline(level + 1)
+        prefix = '{' + newline
+        if root.attrib:
+            parts.append(prefix + writer.key('attributes'))
+            self._write_members(attributes, writer, level + 1)
+            prefix = writer.item_separator + newline
+        if items:
+            item_newline = writer.newline(level + 2)
+            parts.append(prefix + writer.key('children') + '[' + item_newline)
+            if text is not _NO_TEXT:
+                parts.append(writer.value(text, level + 2))
+                if children:
+                    parts.append(writer.item_separator + item_newline)
+            for index, child in enumerate(children):
+                if index:
+                    parts.append(writer.item_separator + item_newline)
+                yield from self._write_children([child], context, writer, level + 2)
+            parts.append(newline + ']')
+        parts.append(writer.newline(level) + '}')
+
 
 # The difference between Cobra and Abdera is that Cobra _always_ has 'attributes' keys,
 # 'children' key is remove when only one child and everything is a string.
@@ -975,9 +2078,9 @@ class Cobra(XMLData):
     def etree(self, data, root=None):
         '''Convert data structure into a list of etree.Element'''
         result = self.list() if root is None else root
-        if isinstance(data, (self.dict, dict)):
+        if isinstance(data, (self.dict, Mapping)):
             for key, value in data.items():
-                if isinstance(value, (self.dict, dict)):
+                if isinstance(value, (self.dict, Mapping)):
                     elem = self.element(key)
                     if elem is None:
                         continue
@@ -1008,75 +2111,65 @@ class Cobra(XMLData):
 
         return result
 
-    def data(self, root):
-        '''Convert etree.Element into a dictionary'''
+    def _xml_parts(self, tag, value):
+        if not isinstance(value, (self.dict, Mapping)):
+            return self.etree({tag: value})[0], ()
+        element = self.etree({tag: self.dict([('attributes', value.get('attributes', {}))])})[0]
+        children = value.get('children', ())
+        # like in etree(), the last text child is the text of the element
+        texts = [child for child in children if not isinstance(child, (self.dict, Mapping))]
+        if texts:
+            element.text = self._tostring(texts[-1])
+        return element, (child for child in children if isinstance(child, (self.dict, Mapping)))
 
-        value = self.dict()
-        nsmap = root.nsmap
-        tag = ET.QName(root).localname
+    def _node(self, root, schema, context):
+        '''Conversion frame for one etree.Element'''
 
-        # if typemapping is based on xml schema, search schema for element and get type
-        if self.schema_typing:
-            self._manage_schema_stack(root)
+        value = self.dict()
+        tag = self._qname(root.tag, context)[0]
 
-        self.is_doc_root = False
+        context.is_doc_root = False
 
         # Add attributes to 'attributes' key (sorted!) even when empty
         value['attributes'] = self.dict()
         if root.attrib:
             for attr in sorted(root.attrib):
                 # if schema_typing is used and the attribute exists in the schema
-                if self.schema_typing:
-                    schema_att_element = self.schema_attribute_stack[-1]
-                    schema_types = schema_att_element.type
-                    schema_attributes = schema_types.attributes
+                if schema is not None:
                     # if we find the attribute
-                    if schema_attributes.get(attr):
+                    if attr in schema.attributes:
                         # attribute types are always simple types
-                        schema_attribute_type = schema_attributes.get(attr).type.base_type
-                        attrval = self._typemapping(root.attrib[attr], schema_attribute_type)
+                        attrval = schema.attributes[attr](root.attrib[attr])
                         # harmonize synonyms
                         if self.harmonize_synonyms:
                             attrval = self._harmonize_tag(attrval)
                         value['attributes'][unicode(attr)] = attrval
 
-                if not self.schema_typing:
+                if schema is None:
                     # harmonize synonyms
                     if self.harmonize_synonyms:
                         attrval = self._harmonize_tag(attrval)
                     value['attributes'][unicode(attr)] = root.attrib[attr]
 
-        # remove the last item from attribute stack (only if we have attributes and stack is not empty)
-        if self.schema_attribute_stack and root.attrib.items():
-            self.schema_attribute_stack.pop()
-
         # Add children to specific 'children' key
         children_list = self.list()
-        children = [node for node in root if isinstance(node.tag, basestring)]
+        children, tags, counts = self._grouped_children(root, context)
 
         # Add root text
         if root.text and self.text_content is not None:
             text = root.text
 
-            if self.schema_typing and self.schema_element.type:
-                schema_types = self.schema_element.type
+            if schema is not None:
                 # if a simple type exists
-                if schema_types.simple_type:
+                if schema.text is not None:
                     if text.strip():
-                        # get simple type
-                        schema_simple_type = schema_types.simple_type
-                        # if a base type exists
-                        if schema_types.simple_type.base_type:
-                            schema_base_type = schema_types.simple_type.base_type
-                            text = self._typemapping(text, schema_base_type)
-                        else:
-                            text = self._typemapping(text, schema_simple_type)
+                        text = schema.text(text)
 
                         if self.simple_text and len(children) == len(root.attrib) == 0:
-                            value = text.rstrip()
+                            value = text
                         else:
                             value[self.text_content] = text
-                            children_list = [text.rstrip(), ]
+                            children_list = [text, ]
 
 
             else:
@@ -1086,28 +2179,16 @@ class Cobra(XMLData):
                     else:
                         children_list = [self._fromstring(text.rstrip()), ]
 
-        count = Counter(child.tag for child in children)
-        for child in children:
-
-            if self.schema_typing:
-                self._find_schema_element(child)
-
-            child_data = self.data(child)
-            if (count[child.tag] == 1 and
+        for child, child_tag in zip(children, tags):
+            child_data = yield child
+            if (counts[child_tag] == 1 and
                     len(children_list) > 1 and
                     isinstance(children_list[-1], dict)):
                 # Merge keys to existing dictionary
                 children_list[-1].update(child_data)
             else:
                 # Add additional text
-                children_list.append(self.data(child))
-
-        if self.schema_typing:
-            if children:
-                self.schema_stack.pop()
-                # todo das hier will ich nur machen wenn ich nicht bei der root bin
-                if self.schema_stack:
-                    self.root_schema_element = self.schema_stack[-1]
+                children_list.append(child_data)
 
         if len(children_list) > 0:
             value['children'] = children_list
@@ -1118,23 +2199,116 @@ class Cobra(XMLData):
         # if we want prefixed objectnames
         if self.ns_as_prefix:
             # use this function if prefix abbr. and not uris are wanted
-            tag = self._uri_to_prefix(root.tag, nsmap)
+            nsmap = root.nsmap
+            tag = self._prefixed(root.tag, nsmap, self._scope(nsmap, context), context)
             # use this if uris as prefix are wanted
             # tag = root.tag
             return self.dict([(unicode(tag), value)])
 
+    def _write_node(self, root, schema, context, writer, level):
+        '''Writer frame for one etree.Element, see XMLData._write_node'''
+        context.is_doc_root = False
+        # attributes are sorted and always written
+        attributes = []
+        for attr in sorted(root.attrib):
+            if schema is not None:
+                convert = schema.attributes.get(attr)
+                if convert is None:
+                    continue
+                attributes.append((unicode(attr), convert(root.attrib[attr])))
+            else:
+                attributes.append((unicode(attr), root.attrib[attr]))
+        children, tags, counts = self._grouped_children(root, context)
+
+        text, members = _NO_TEXT, [('attributes', attributes)]
+        if root.text and self.text_content is not None:
+            if schema is not None:
+                if schema.text is not None and root.text.strip():
+                    text = schema.text(root.text)
+                    members.append((self.text_content, text))
+            elif root.text.strip():
+                text = self._fromstring(root.text.rstrip())
+            if (text is not _NO_TEXT and self.simple_text and
+                    len(children) == len(root.attrib) == 0):
+                writer.parts.append(writer.value(text, level))
+                return
+
+        # items of 'children': the text, then the data of children. A child with a unique tag
+        # after the second item is merged into the previous child data
+        items = [] if text is _NO_TEXT else [text]
+        for child, child_tag in zip(children, tags):
+            if counts[child_tag] == 1 and len(items) > 1:
+                items[-1].append(child)
+            else:
+                items.append([child])
+        for item in items[1 if text is not _NO_TEXT else 0:]:
+            if (len(item) > 1 and
+                    len(set(self._wrap_key(child, context) for child in item)) < len(item)):
+                # merged children with the same key
+                return self._write_data(root, schema, context, writer, level)
+
+        parts = writer.parts
+        newline = writer.newline(level + 1)
+        separator = writer.item_separator + newline
+        parts.append('{' + newline + writer.key('attributes'))
+        self._write_members(attributes, writer, level + 1)
+        if len(members) > 1:
+            parts.append(separator + writer.key(self.text_content) + writer.value(text, level + 1))
+        if items:
+            item_newline = writer.newline(level + 2)
+            parts.append(separator + writer.key('children') + '[' + item_newline)
+            for index, item in enumerate(items):
+                if index:
+                    parts.append(writer.item_separator + item_newline)
+                if isinstance(item, list):
+                    yield from self._write_children(item, context, writer, level + 2)
+                else:
+                    parts.append(writer.value(item, level + 2))
+            parts.append(newline + ']')
+        parts.append(writer.newline(level) + '}')
+
 
 class Yahoo(XMLData):
     '''Converts between XML and data using the Yahoo convention'''
 
     def __init__(self, **kwargs):
         kwargs.setdefault('xml_fromstring', False)
-        super(Yahoo, self).__init__(text_content='content', simple_text=True, conv="yahoo")
+        super(Yahoo, self).__init__(text_content='content', simple_text=True, conv="yahoo",
+                                    **kwargs)
+
+
+# converter and parser of worker processes in XMLData.convert_parallel
+_parallel_converter = None
+_parallel_parser = None
+
+
+def _parallel_init(converter, parser_options):
+    global _parallel_converter, _parallel_parser
+    _parallel_converter = converter
+    _parallel_parser = ET.XMLParser(**parser_options)
+
+
+def _parallel_convert(task):
+    '''Convert one serialized record with its path from the document root'''
+    xml, path = task
+    conv = _parallel_converter
+    record = ET.fromstring(xml, _parallel_parser)
+    schema = conv.schema_index.lookup(path) if path is not None else None
+    # records are converted as children, not as document roots
+    return conv._walk(record, schema, context=_Context(is_doc_root=False))
+
+
+# module level converters with default options, created on first use: xmljson.parker, ...
+_default_converters = {'abdera': Abdera, 'badgerfish': BadgerFish, 'cobra': Cobra,
+                       'gdata': GData, 'parker': Parker, 'yahoo': Yahoo}
+
+
+def __getattr__(name):
+    if name in _default_converters:
+        converter = globals()[name] = _default_converters[name]()
+        return converter
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
 
 
-abdera = Abdera()
-badgerfish = BadgerFish()
-cobra = Cobra()
-gdata = GData()
-parker = Parker()
-yahoo = Yahoo()
+def __dir__():
+    return sorted(set(globals()) | set(_default_converters))
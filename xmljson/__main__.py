@@ -1,13 +1,15 @@
+import os
 import sys
-import json
+import glob
 import argparse
+import time
 from contextlib import closing
 import xmljson
 
 try:
-    from lxml.etree import parse
+    from lxml.etree import parse, fromstring
 except ImportError:
-    from xml.etree.cElementTree import parse
+    from xml.etree.cElementTree import parse, fromstring
 
 dialects = {
     key.lower(): val for key, val in sorted(vars(xmljson).items())
@@ -17,27 +19,199 @@ dialects = {
 
 def parse_args(args=None, in_file=sys.stdin, out_file=sys.stdout):
     parser = argparse.ArgumentParser(prog='xmljson')
-    parser.add_argument('in_file', type=argparse.FileType(), nargs='?', default=in_file,
-                        help='defaults to stdin')
+    parser.add_argument('in_file', nargs='*',
+                        help='defaults to stdin, several files or glob patterns need --out-dir')
     parser.add_argument('-o', '--out_file', type=argparse.FileType('w'), default=out_file,
                         help='defaults to stdout')
     parser.add_argument('-d', '--dialect', choices=list(dialects.keys()), default='parker',
                         type=str.lower, help='defaults to parker')
+    parser.add_argument('-c', '--compact', action='store_true',
+                        help='write JSON without indentation and whitespace')
+    parser.add_argument('-n', '--ndjson', action='store_true',
+                        help='write one JSON object per line for every --record-tag element')
+    parser.add_argument('-r', '--record-tag', action='append',
+                        help='tag or localname of record elements, can be repeated')
+    parser.add_argument('-m', '--mmap', action='store_true',
+                        help='memory-map in_file instead of reading it, needs a regular file')
+    parser.add_argument('-s', '--stats', action='store_true',
+                        help='print time per phase, counts and cache hit rates to stderr')
+    parser.add_argument('-x', '--schema', help='XML schema (XSD) for datatype mapping')
+    parser.add_argument('--schema-cache', metavar='DIR',
+                        help='keep compiled schemas in this directory for later calls')
+    parser.add_argument('-O', '--out-dir',
+                        help='batch mode: write every in_file as IN.json (IN.ndjson) to this '
+                             'directory')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='worker processes in batch mode, defaults to the number of CPUs')
+    parser.add_argument('-M', '--manifest', type=argparse.FileType(),
+                        help='file with more input files for batch mode, one per line')
     args = parser.parse_args() if args is None else parser.parse_args(args)
 
+    inputs = expand(args.in_file)
+    if args.manifest:
+        with closing(args.manifest) as manifest:
+            inputs += [line.strip() for line in manifest
+                       if line.strip() and not line.startswith('#')]
+    if args.out_dir is None and len(inputs) > 1:
+        parser.error('several input files require --out-dir')
+    if args.out_dir is not None and not inputs:
+        parser.error('--out-dir requires input files')
+    if args.out_dir is not None and args.stats:
+        parser.error('--stats converts a single file')
+
+    if args.ndjson and not args.record_tag:
+        parser.error('--ndjson requires --record-tag')
+
+    if args.mmap and not inputs:
+        parser.error('--mmap requires an in_file')
+
+    if args.schema_cache:
+        xmljson.schema_cache_dir = args.schema_cache
+
     if args.dialect not in dialects:
         raise TypeError('Unknown dialect: %s' % args.dialect)
     else:
-        dialect = dialects[args.dialect]()
+        # the schema is loaded once, batch workers get the compiled schema index
+        dialect = dialects[args.dialect](stats=xmljson.Stats() if args.stats else None,
+                                         xml_schema=args.schema)
+
+    if inputs and args.out_dir is None:
+        try:
+            in_file = argparse.FileType()(inputs[0])
+        except argparse.ArgumentTypeError as error:
+            parser.error(str(error))
+
+    options = {'compact': args.compact, 'ndjson': args.ndjson, 'record_tag': args.record_tag,
+               'mmap': args.mmap, 'inputs': inputs, 'out_dir': args.out_dir, 'jobs': args.jobs}
+    return in_file, args.out_file, dialect, options
 
-    return args.in_file, args.out_file, dialect
 
+def expand(paths):
+    '''Return paths with glob patterns replaced by the files they match, e.g. for shells that
+    do not expand them. Patterns without matches are kept and fail like missing files.'''
+    inputs = []
+    for path in paths:
+        matches = sorted(glob.glob(path)) if any(char in path for char in '*?[') else []
+        inputs.extend(matches or [path])
+    return inputs
 
-def main(*test_args):
-    in_file, out_file, dialect = parse_args() if not test_args else test_args
+
+def main(*test_args, **options):
+    if test_args:
+        in_file, out_file, dialect = test_args
+    else:
+        in_file, out_file, dialect, options = parse_args()
+    if options.get('out_dir') is not None:
+        return batch(dialect, options['inputs'], options['out_dir'], options)
+    start = time.perf_counter()
     with closing(in_file) as in_file, closing(out_file) as out_file:
-        json.dump(dialect.data(parse(in_file).getroot()), out_file, indent=2)
+        if options.get('mmap'):
+            with xmljson.mapped(in_file) as source:
+                convert(dialect, source, out_file, options)
+        else:
+            convert(dialect, in_file, out_file, options)
+    if dialect.stats is not None:
+        # shares of the total run time, the rest is mostly writing JSON
+        sys.stderr.write(dialect.stats.report(total=time.perf_counter() - start) + '\n')
+
+
+def convert(dialect, in_file, out_file, options):
+    '''Write in_file (a file object or a memory map of it) as JSON to out_file'''
+    if options.get('ndjson'):
+        # iterparse reads bytes, not text
+        source = getattr(in_file, 'buffer', in_file)
+        out_file.writelines(dialect.ndjson(source, options['record_tag']))
+        return
+    # JSON is written while the document is converted, see XMLData.dump
+    if options.get('compact'):
+        kwargs = {'separators': (',', ':')}
+    else:
+        kwargs = {'indent': 2}
+    # a memory map is parsed in place, without reading it into a bytes object
+    read = fromstring if options.get('mmap') else lambda source: parse(source).getroot()
+    if dialect.stats is not None:
+        read = dialect.stats.timed('parse', read)
+    dialect.dump(read(in_file), out_file, **kwargs)
+
+
+def convert_file(dialect, in_path, out_path, options):
+    '''Convert the file in_path to out_path'''
+    with open(in_path, 'rb') as in_file, open(out_path, 'w', encoding='utf-8') as out_file:
+        if options.get('mmap'):
+            with xmljson.mapped(in_file) as source:
+                convert(dialect, source, out_file, options)
+        else:
+            convert(dialect, in_file, out_file, options)
+
+
+def batch(dialect, inputs, out_dir, options):
+    '''Convert every file of inputs to a file in out_dir, in options['jobs'] worker processes
+    (one per CPU by default). Failures are reported on stderr and do not stop the other files.
+    Prints the throughput to stderr, returns 1 if a file failed, else 0.'''
+    suffix = '.ndjson' if options.get('ndjson') else '.json'
+    os.makedirs(out_dir, exist_ok=True)
+    tasks, failed, outputs = [], 0, {}
+    for in_path in inputs:
+        out_path = os.path.join(out_dir, os.path.splitext(os.path.basename(in_path))[0] + suffix)
+        if out_path in outputs:
+            sys.stderr.write('xmljson: %s: same output file as %s\n' % (
+                in_path, outputs[out_path]))
+            failed += 1
+        else:
+            outputs[out_path] = in_path
+            tasks.append((in_path, out_path))
+
+    start = time.perf_counter()
+    jobs = options.get('jobs') or os.cpu_count() or 1
+    if jobs == 1:
+        _batch_init(dialect, options)
+        results = map(_batch_convert, tasks)
+    else:
+        # imported here, single file conversions start without it
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(min(jobs, len(tasks) or 1), initializer=_batch_init,
+                                   initargs=(dialect, options))
+        results = pool.map(_batch_convert, tasks)
+    converted = size = 0
+    try:
+        for in_path, in_size, error in results:
+            if error is None:
+                converted += 1
+                size += in_size
+            else:
+                failed += 1
+                sys.stderr.write('xmljson: %s: %s\n' % (in_path, error))
+    finally:
+        if jobs != 1:
+            pool.shutdown()
+    seconds = time.perf_counter() - start
+    sys.stderr.write('%d files, %.1f MB in %.2f s: %.1f files/s, %.1f MB/s, %d failed\n' % (
+        converted, size / 1e6, seconds, converted / seconds, size / 1e6 / seconds, failed))
+    return 1 if failed else 0
+
+
+# converter and options of batch worker processes
+_batch_dialect = None
+_batch_options = None
+
+
+def _batch_init(dialect, options):
+    global _batch_dialect, _batch_options
+    _batch_dialect, _batch_options = dialect, options
+
+
+def _batch_convert(task):
+    '''Convert one file, return (in_path, size, error message or None)'''
+    in_path, out_path = task
+    try:
+        convert_file(_batch_dialect, in_path, out_path, _batch_options)
+        return in_path, os.path.getsize(in_path), None
+    except Exception as error:
+        # no partial output
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        return in_path, 0, '%s: %s' % (type(error).__name__, error)
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+'''
+Compact output containers for repeated children, e.g. the Samples of a MINiML document.
+
+RecordList can be passed as list_type=. Children that have the same keys as the first child in
+the list are stored as tuples of their values (one tuple instead of one dict per child) and read
+back as Record mappings. json cannot encode them directly, pass default=json_default:
+json.dumps(data, default=json_default). XMLData.dump does this by itself.
+'''
+from collections.abc import Mapping, Sequence
+
+
+class Record(Mapping):
+    '''Read-only mapping of keys (shared by all records of a RecordList) to values'''
+    __slots__ = ('_keys', '_values')
+
+    def __init__(self, keys, values):
+        self._keys = keys
+        self._values = values
+
+    def __getitem__(self, key):
+        try:
+            return self._values[self._keys.index(key)]
+        except ValueError:
+            raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return 'Record(%r)' % dict(zip(self._keys, self._values))
+
+
+class RecordList(Sequence):
+    '''List of the data of repeated children that stores dicts with the keys of the first dict
+    as tuples of their values. Other items, and the last item until another one is appended, are
+    stored as they are.'''
+    __slots__ = ('_keys', '_rows')
+
+    def __init__(self, items=()):
+        # keys of the first dict, None until one is added
+        self._keys = None
+        self._rows = []
+        self.extend(items)
+
+    def append(self, item):
+        # the last item stays as it is, conventions may still update it (Cobra)
+        if self._rows:
+            self._rows[-1] = self._pack(self._rows[-1])
+        self._rows.append(item)
+
+    def _pack(self, item):
+        if isinstance(item, dict):
+            keys = tuple(item)
+            if self._keys is None:
+                self._keys = keys
+            if keys == self._keys:
+                return tuple(item.values())
+        return item
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def _item(self, row):
+        # converted data never contains tuples, they are packed records
+        return Record(self._keys, row) if type(row) is tuple else row
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._item(row) for row in self._rows[index]]
+        return self._item(self._rows[index])
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, RecordList)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __repr__(self):
+        return 'RecordList(%r)' % list(self)
+
+
+def json_default(obj):
+    '''json default function for RecordList and Record'''
+    if isinstance(obj, RecordList):
+        return list(obj)
+    if isinstance(obj, Record):
+        return dict(obj)
+    raise TypeError('Object of type %s is not JSON serializable' % type(obj).__name__)
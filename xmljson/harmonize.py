@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+'''
+Parsers that extract raw data (age, concentration and compound, exposure duration) from the
+content of MINiML Characteristics and Treatment-Protocol elements, used by harmonize_synonyms.
+
+Patterns are compiled once. GEO repeats the same values in thousands of samples, so parse results
+are memoized by content string.
+'''
+import re
+from functools import lru_cache
+
+# number of memoized results per parser
+CACHE_SIZE = 4096
+
+# (number)(unit), e.g. '24 hpf'
+_number_and_unit = re.compile(r'(\d+\.*\d*\s?)([a-zA-Z]*)')
+# times that pollute treatment data, e.g. '30 min'
+_time = re.compile(r'(\d+\.*\d*\s?(millisecond|second|hour|minute|milliseconds'
+                   r'|seconds|hours|minutes|sec|min|ms\b|s\b|m\b|h\b))')
+# (number)(unit), units may contain a '/', e.g. '10 mg/l'
+_concentration = re.compile(r'(\d+\.*\d*\s?)([a-zA-Z]*[/]?[a-zA-Z]*)')
+_concentration_text = re.compile(r'\d+\.*\d*\s?[a-zA-Z]*[/]?[a-zA-Z]*')
+# (number)(time unit), e.g. '0.5h'
+_duration = re.compile(r'(\d+\.*\d*\s?)(millisecond|second|hour|minute'
+                       r'|milliseconds|seconds|hours|minutes|sec|min|ms\b|s\b|m\b|h\b)')
+
+# abbreviations that are checked to determine the unit, mapped to units per hour
+units_per_hour = {}
+units_per_hour.update(dict.fromkeys(
+    ["s", "s.", "sec", "sec.", "secs", "second", "seconds", "spf",
+     "seconds post fertilization"], 3600))
+units_per_hour.update(dict.fromkeys(
+    ["m", "m.", "min", "min.", "mins", "minute", "minutes", "mpf",
+     "minutes post fertilization"], 60))
+units_per_hour.update(dict.fromkeys(
+    ["h", "h.", "hour", "hours", "hpf", "hours post fertilization", "hours post fert."], 1))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_for_hpf(content):
+    '''Parse content for a number and a unit, returns the first tuple ("time", "unit")'''
+    return _number_and_unit.findall(content)[0]
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _concentration_and_compound(content):
+    # remove time entries from text, since sometimes times pollute the data
+    text_without_time = _time.sub('', content)
+    numbers_and_units = _concentration.findall(text_without_time)
+
+    # remove numbers_and_units from text, rest is compound
+    compound = _concentration_text.sub('', text_without_time).strip()
+    # assumption: only one unit couple
+    if not numbers_and_units:
+        return None, compound
+    concentration_number = numbers_and_units[0][0].split()[0]
+    concentration_unit = numbers_and_units[0][1].split()[0]
+    return concentration_number + " " + concentration_unit, compound
+
+
+def parse_for_concentration_and_compound(content):
+    '''Parse treatment data, returns tuple (concentration + unit, compound).
+    concentration is an empty list if content has none.'''
+    concentration, compound = _concentration_and_compound(content)
+    # new list for every call, the memoized result is shared
+    return (concentration if concentration is not None else [], compound)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_for_exposure_duration(content):
+    '''Parse treatment data for duration, returns tuple (duration, unit)'''
+    return _duration.findall(content)[0]
+
+
+def convert_to_hours(duration, unit):
+    '''Convert duration (a number or string) in unit to hours, None if the unit is unknown'''
+    duration = float(duration)
+    per_hour = units_per_hour.get(unit)
+    return duration / per_hour if per_hour is not None else None
+
+
+def calculate_exposure_start(age, age_unit, duration, duration_unit):
+    '''Return difference between age and duration in hours as string, e.g. "20.0 hours"'''
+    # assumption: exposure starts at embryo age - duration
+    exposure_start_in_hours = (convert_to_hours(age, age_unit) -
+                               convert_to_hours(duration, duration_unit))
+    return str(round(exposure_start_in_hours, 4)) + " hours"
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+'''
+Type inference for XML string values: None, boolean, int, float or the string itself.
+
+infer_type() classifies a value with one precompiled pattern. Values the pattern cannot decide
+(surrounding whitespace, underscores) take the exception based slow path, so results are the
+same as int() and float() give. TypeInference adds an optional bounded cache and can be passed as
+xml_fromstring=, e.g. GData(xml_fromstring=TypeInference(cache_size=4096)).
+'''
+import re
+from functools import lru_cache
+from math import isfinite
+
+# group 1: integer, group 2: decimal or exponent notation (digits as accepted by int and float)
+_number = re.compile(r'[+-]?(?:(\d+)|(\d*\.\d+(?:[eE][+-]?\d+)?|\d+\.?\d*[eE][+-]?\d+|\d+\.))')
+_booleans = {'true': True, 'false': False}
+
+
+def _slow_infer_type(value):
+    '''Convert value with int() and float(), exceptions as control flow'''
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    # infinity and NaN stay strings
+    return number if isfinite(number) else value
+
+
+def infer_type(value):
+    '''Convert XML string value to None, boolean, int or float.
+    Booleans are case insensitive, numbers with leading zeros (e.g. '0123', '0.5') and infinite
+    or NaN numbers stay strings.'''
+    if value is None:
+        return None
+    # only strings of up to 5 characters starting with t, T, f or F lower case to 'true' or 'false'
+    if len(value) < 6 and value[:1] in 'tTfF':
+        boolean = _booleans.get(value.lower())
+        if boolean is not None:
+            return boolean
+    if value.startswith('0'):
+        return value
+    if value.isdecimal():
+        try:
+            return int(value)
+        except ValueError:
+            # more digits than sys.get_int_max_str_digits()
+            return _slow_infer_type(value)
+
+    match = _number.fullmatch(value)
+    if match is None:
+        # int() and float() also accept surrounding whitespace and underscores
+        if '_' in value or value[:1].isspace() or value[-1:].isspace():
+            return _slow_infer_type(value)
+        return value
+    if match.group(1) is not None:
+        try:
+            return int(value)
+        except ValueError:
+            # more digits than sys.get_int_max_str_digits()
+            return _slow_infer_type(value)
+    number = float(value)
+    return number if isfinite(number) else value
+
+
+class TypeInference(object):
+    '''infer_type() with an optional bounded cache of cache_size values, for documents that repeat
+    the same values (e.g. GEO sample attributes). Instances can be pickled.'''
+
+    def __init__(self, cache_size=0):
+        self.cache_size = cache_size
+        self._infer = lru_cache(maxsize=cache_size)(infer_type) if cache_size else infer_type
+
+    def __call__(self, value):
+        return self._infer(value)
+
+    def __getstate__(self):
+        return {'cache_size': self.cache_size}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
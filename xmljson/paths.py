@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+'''
+Simple XPath-like paths that select the elements a conversion includes or excludes.
+
+A path is a sequence of steps separated by '/'. A step is a localname (any namespace), a full tag
+('{uri}name') or '*' (any element). '/MINiML/Sample' starts at the document root, '//' (or no
+leading '/') matches at any depth, e.g. 'Sample/Characteristics' or '/MINiML//Characteristics'.
+
+PathFilter matches paths step by step while a tree is walked, so elements are selected by the
+tags of their ancestors only, without XPath evaluation over the whole tree.
+'''
+import re
+
+# '/' and '//' separators, full tags may contain '/' in their namespace uri
+_tokens = re.compile(r'//?|\{[^}]*\}[^/]*|[^/]+')
+
+
+def compile_path(path):
+    '''Return the steps of path as a tuple of (name, descendant), descendant is True if the step
+    can match any number of levels below the previous one'''
+    tokens = _tokens.findall(path.strip())
+    if not tokens or tokens[-1] in ('/', '//'):
+        raise ValueError('Invalid path: %r' % path)
+    steps = []
+    # paths without a leading '/' match at any depth
+    descendant = tokens[0] != '/'
+    for token in tokens:
+        if token in ('/', '//'):
+            descendant = descendant or token == '//'
+            continue
+        steps.append((token, descendant))
+        descendant = False
+    return tuple(steps)
+
+
+def _paths(paths):
+    if paths is None:
+        return ()
+    if isinstance(paths, str):
+        paths = [paths]
+    return tuple(compile_path(path) for path in paths)
+
+
+def _advance(positions, tag, paths):
+    '''Return (positions after matching tag, True if tag completes a path)'''
+    localname = tag.rpartition('}')[2]
+    advanced, matched = set(), False
+    for path, index in positions:
+        name, descendant = paths[path][index]
+        if descendant:
+            # the step can still match further down
+            advanced.add((path, index))
+        if name == '*' or name == localname or name == tag:
+            if index + 1 == len(paths[path]):
+                matched = True
+            else:
+                advanced.add((path, index + 1))
+    return frozenset(advanced), matched
+
+
+class PathFilter(object):
+    '''Selects elements by include and exclude paths (a path or a sequence of paths).
+    Without include, all elements are included. Included are the elements that match an include
+    path, their descendants and the ancestors that lead to them. Excluded elements are skipped with
+    all their descendants, also if they are included.
+
+    The state of an element is None if it is skipped, otherwise a tuple (include positions or True
+    if an ancestor or the element matched an include path, exclude positions).'''
+
+    def __init__(self, include=None, exclude=None):
+        self.include = _paths(include)
+        self.exclude = _paths(exclude)
+        self.start = (frozenset((path, 0) for path in range(len(self.include))) or True,
+                      frozenset((path, 0) for path in range(len(self.exclude))))
+        # (state, tag) -> state, documents repeat the same paths
+        self._states = {}
+
+    def child(self, state, tag):
+        '''Return the state of an element with tag whose parent has state'''
+        key = (state, tag)
+        if key not in self._states:
+            self._states[key] = self._child(state, tag)
+        return self._states[key]
+
+    def _child(self, state, tag):
+        if state is None:
+            return None
+        include, exclude = state
+        exclude, excluded = _advance(exclude, tag, self.exclude)
+        if excluded:
+            return None
+        if include is True:
+            return True, exclude
+        include, matched = _advance(include, tag, self.include)
+        if matched:
+            return True, exclude
+        return (include, exclude) if include else None
+
+    def state(self, path):
+        '''Return the state of the element with path, the tags from the document root to it'''
+        state = self.start
+        for tag in path:
+            state = self.child(state, tag)
+        return state
+
+    @staticmethod
+    def kept(state, has_kept_child):
+        '''True if an element with state is converted, given whether a child of it is converted'''
+        return state is not None and (state[0] is True or has_kept_child)
+
+    def skipped(self, root, state):
+        '''Return the set of elements below root (whose state is state) that are not converted.
+        Descendants of skipped elements are not in the set.'''
+        if state is None:
+            return set(root)
+        skipped = set()
+        # [element, state, child iterator, True if a child is kept], walked without recursion
+        frames = [[root, state, iter(root), False]]
+        while frames:
+            frame = frames[-1]
+            child = next(frame[2], None)
+            if child is None:
+                frames.pop()
+                if not self.kept(frame[1], frame[3]):
+                    skipped.add(frame[0])
+                elif frames:
+                    frames[-1][3] = True
+                continue
+            if not isinstance(child.tag, str):
+                continue
+            child_state = self.child(frame[1], child.tag)
+            if child_state is None:
+                skipped.add(child)
+            elif child_state[0] is True and not child_state[1]:
+                # included with nothing left to exclude, the whole subtree is kept
+                frame[3] = True
+            else:
+                frames.append([child, child_state, iter(child), False])
+        return skipped
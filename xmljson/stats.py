@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+'''
+Opt-in conversion statistics: time per phase, numbers of converted elements, attributes and texts
+and cache hit rates, e.g. to find out why a conversion is slow.
+
+Pass a Stats object to a converter, e.g. GData(stats=Stats()). Only converters created with
+stats= are instrumented, all others run exactly the code they run without this module.
+'''
+from time import perf_counter
+
+# phases of a conversion, 'convert' includes the time of the phases after it
+PHASES = ('parse', 'convert', 'namespaces', 'schema', 'inference', 'harmonize')
+COUNTS = ('elements', 'attributes', 'texts')
+
+
+class Stats(object):
+    '''Statistics of all conversions of the converters it is passed to.
+    timings: phase (see PHASES) -> seconds. 'parse' is only recorded when the converter parses
+    (iterdata, ndjson), 'convert' is the time spent converting elements including namespaces,
+    schema typing, type inference and harmonization.
+    counts: 'elements', 'attributes', 'texts' -> number converted.
+    caches: cache name -> [hits, misses].
+    Stats are not thread safe, give every thread its own converter and Stats object.'''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.timings = dict.fromkeys(PHASES, 0.0)
+        self.counts = dict.fromkeys(COUNTS, 0)
+        self.caches = {}
+
+    def timed(self, phase, func):
+        '''Return func, adding the time of its calls to phase'''
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.timings[phase] += perf_counter() - start
+        return timed
+
+    def timed_iter(self, phase, iterable):
+        '''Iterate over iterable, adding the time spent to get its items to phase'''
+        iterator = iter(iterable)
+        while True:
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.timings[phase] += perf_counter() - start
+            yield item
+
+    def hit(self, cache, hit):
+        '''Count a lookup in cache, hit is True if it found the value'''
+        counts = self.caches.setdefault(cache, [0, 0])
+        counts[0 if hit else 1] += 1
+
+    def as_dict(self):
+        '''Return timings, counts and caches as one JSON compatible dict'''
+        return {'timings': dict(self.timings), 'counts': dict(self.counts),
+                'caches': {cache: {'hits': hits, 'misses': misses}
+                           for cache, (hits, misses) in self.caches.items()}}
+
+    def report(self, total=None):
+        '''Return the statistics as a text table. Shares are relative to total seconds,
+        by default parse and convert time.'''
+        timings = self.timings
+        total = total or (timings['parse'] + timings['convert']) or 1.0
+        other = timings['convert'] - sum(timings[phase] for phase in PHASES[2:])
+        lines = ['%-14s %10s %8s' % ('phase', 'seconds', 'share')]
+        for phase, seconds in [(phase, timings[phase]) for phase in PHASES] + [('other', other)]:
+            # indent the phases that are part of convert
+            name = phase if phase in PHASES[:2] else '  ' + phase
+            lines.append('%-14s %10.3f %7.1f%%' % (name, seconds, 100 * seconds / total))
+        lines.append('')
+        lines.append('  '.join('%s %d' % (name, self.counts[name]) for name in COUNTS))
+        if self.caches:
+            lines.append('')
+            lines.append('%-14s %10s %10s %8s' % ('cache', 'hits', 'misses', 'hit rate'))
+            for cache, (hits, misses) in sorted(self.caches.items()):
+                lines.append('%-14s %10d %10d %7.1f%%' % (cache, hits, misses,
+                                                          100.0 * hits / ((hits + misses) or 1)))
+        return '\n'.join(lines)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+'''
+JSON text output for XMLData.dump: conventions write the JSON of the elements they convert
+straight to a JSONWriter, without building the dicts and lists of data() first.
+
+JSONWriter formats like json.dump with the same indent, separators and ensure_ascii, so the text
+is identical to json.dump(data, fp). Encoded keys and indentation strings are cached, documents
+repeat the same keys in every record.
+'''
+import json
+from json.encoder import encode_basestring, encode_basestring_ascii
+
+# number of text parts collected before they are written to the file in one call
+BUFFER_PARTS = 4096
+
+
+def _float(value):
+    # like json.dump (allow_nan=True)
+    if value != value:
+        return 'NaN'
+    if value == float('inf'):
+        return 'Infinity'
+    if value == float('-inf'):
+        return '-Infinity'
+    return float.__repr__(value)
+
+
+class JSONWriter(object):
+    '''Buffered JSON output to the file-like object fp, formatted like
+    json.dump(obj, fp, indent=indent, separators=separators, ensure_ascii=ensure_ascii).
+    Conventions append text to parts: values (value()), keys with their separator (key()),
+    item separators (item_separator) and newline(level) after brackets and separators.
+    default is the json default function for containers that json cannot encode.'''
+
+    def __init__(self, fp, indent=None, separators=None, ensure_ascii=True, default=None):
+        self.fp = fp
+        if indent is not None and not isinstance(indent, str):
+            indent = ' ' * indent
+        self.indent = indent
+        if separators is None:
+            # json.dump drops the space after ',' when indenting
+            separators = (',', ': ') if indent is not None else (', ', ': ')
+        self.item_separator, self.key_separator = separators
+        self.string = encode_basestring_ascii if ensure_ascii else encode_basestring
+        # containers are written by json, indented by value() where they are nested
+        self._encoder = json.JSONEncoder(indent=indent, separators=separators,
+                                         ensure_ascii=ensure_ascii, default=default)
+        self.parts = []
+        # key -> encoded key with key separator, level -> newline with indentation
+        self._keys = {}
+        self._newlines = {}
+
+    def key(self, key):
+        '''Return key encoded like json encodes dict keys, followed by the key separator'''
+        encoded = self._keys.get(key)
+        if encoded is None:
+            if isinstance(key, str):
+                text = key
+            elif key is True:
+                text = 'true'
+            elif key is False:
+                text = 'false'
+            elif key is None:
+                text = 'null'
+            elif isinstance(key, float):
+                text = _float(key)
+            elif isinstance(key, int):
+                text = int.__repr__(key)
+            else:
+                raise TypeError('keys must be str, int, float, bool or None, not %s'
+                                % type(key).__name__)
+            encoded = self._keys[key] = self.string(text) + self.key_separator
+        return encoded
+
+    def newline(self, level):
+        '''Return the line break and indentation of level, '' without indent'''
+        if self.indent is None:
+            return ''
+        newline = self._newlines.get(level)
+        if newline is None:
+            newline = self._newlines[level] = '\n' + self.indent * level
+        return newline
+
+    def value(self, value, level):
+        '''Return the JSON text of value, nested containers indented for level'''
+        if isinstance(value, str):
+            return self.string(value)
+        if value is None:
+            return 'null'
+        if value is True:
+            return 'true'
+        if value is False:
+            return 'false'
+        if isinstance(value, int):
+            return int.__repr__(value)
+        if isinstance(value, float):
+            return _float(value)
+        text = self._encoder.encode(value)
+        if self.indent is not None and level:
+            # JSON strings cannot contain line breaks, every one is indentation
+            text = text.replace('\n', self.newline(level))
+        return text
+
+    def flush(self, size=0):
+        '''Write the collected parts to fp if there are more than size'''
+        if len(self.parts) > size:
+            self.fp.write(''.join(self.parts))
+            del self.parts[:]